@@ -0,0 +1,59 @@
+"""Benchmark CLI startup time for commands that should not import boto3.
+
+The budget applies to the time on top of a bare `python -c pass`, since
+interpreter startup itself depends on the environment (site packages, .pth
+files) rather than on AWSnare.
+
+Run from the repository root:
+    python -m benchmarks.bench_cli_startup
+
+For a per-module breakdown use:
+    python -X importtime cli.py config show
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    ["--help"],
+    ["config", "show"],
+]
+RUNS = 10
+BUDGET_MS = 100
+
+
+def time_command(argv):
+    """Median wall time of a command in milliseconds."""
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def imports_boto3(args):
+    """Check if the command imports boto3 at all."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "cli.py", *args],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    return any(line.rstrip().endswith(" boto3") for line in result.stderr.splitlines())
+
+
+def run():
+    interpreter_ms = time_command([sys.executable, "-c", "pass"])
+    print(f"bare interpreter: {interpreter_ms:.1f} ms\n")
+    print(f"{'command':<14} {'median ms':>10} {'overhead':>9} {'boto3':>6} {'budget':>7}")
+    for args in COMMANDS:
+        median_ms = time_command([sys.executable, "cli.py", *args])
+        overhead_ms = median_ms - interpreter_ms
+        status = "ok" if overhead_ms <= BUDGET_MS else "OVER"
+        print(f"{' '.join(args):<14} {median_ms:>10.1f} {overhead_ms:>9.1f} "
+              f"{str(imports_boto3(args)):>6} {status:>7}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,91 @@
+"""Compare CloudTrail decode backends (gzip x JSON) on the same synthetic corpus.
+
+Backends that are not installed (orjson, python-isal) are skipped. The
+"text" rows are the decoding used before the Decoder existed.
+
+Run from the repository root:
+    python -m benchmarks.bench_decoders
+    python -m benchmarks.bench_decoders --files 20 --records 10000
+"""
+
+import argparse
+import gzip
+import importlib.util
+import json
+import tempfile
+import time
+
+from benchmarks import synthetic_cloudtrail
+from core import detection_logic
+
+REPEAT = 3
+
+
+def text_json_load(filepaths):
+    records = 0
+    for filepath in filepaths:
+        with gzip.open(filepath, "rt", encoding="utf-8") as f:
+            records += len(json.load(f)["Records"])
+    return records
+
+
+def text_streaming(filepaths):
+    records = 0
+    for filepath in filepaths:
+        with gzip.open(filepath, "rt", encoding="utf-8") as f:
+            records += sum(1 for _ in detection_logic.iter_records(f))
+    return records
+
+
+def decoder_reader(decoder):
+    def read(filepaths):
+        records = 0
+        for filepath in filepaths:
+            with decoder.open_file(filepath) as f:
+                records += sum(1 for _ in decoder.iter_records(f))
+        return records
+    return read
+
+
+def backends():
+    yield "text + json.load (old load_cloudtrail_file)", text_json_load
+    yield "text + streaming (old scan_file)", text_streaming
+    installed = {"stdlib": True,
+                 "orjson": importlib.util.find_spec("orjson") is not None,
+                 "isal": importlib.util.find_spec("isal") is not None}
+    for gzip_backend in ("stdlib", "isal"):
+        for json_backend in ("stdlib", "orjson"):
+            name = f"gzip={gzip_backend} json={json_backend}"
+            if not (installed[gzip_backend] and installed[json_backend]):
+                yield name, None
+                continue
+            yield name, decoder_reader(detection_logic.Decoder(json_backend, gzip_backend))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode backend benchmark")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--records", type=int, default=5000, help="Records per file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        filepaths = synthetic_cloudtrail.generate(data_dir, args.files, args.records, flat=True)
+        print(f"{args.files} files x {args.records} records\n")
+        print(f"{'backend':<46} {'records/s':>11} {'speedup':>8}")
+        baseline = None
+        for name, read in backends():
+            if read is None:
+                print(f"{name:<46} {'not installed':>11}")
+                continue
+            best = float("inf")
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                records = read(filepaths)
+                best = min(best, time.perf_counter() - start)
+            rate = records / best
+            baseline = baseline or rate
+            print(f"{name:<46} {rate:>11.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Benchmark detection throughput (records/s) and peak memory on synthetic CloudTrail logs.
+
+Each stage runs in a fresh process so its peak RSS is its own; the largest
+worker process of scan_directory_parallel is reported separately. Results are
+appended to benchmarks/results/throughput.jsonl with the git commit, and
+compared with the last run that used the same parameters. Runs offline.
+
+Run from the repository root:
+    python -m benchmarks.bench_detection_throughput
+    python -m benchmarks.bench_detection_throughput --files 50 --records 5000 --hit-ratio 0.05 \\
+        --rules 100 --snares 1000
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import synthetic_cloudtrail
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results", "throughput.jsonl")
+STAGES = ["load_cloudtrail_file", "scan_file", "scan_directory", "scan_directory_parallel",
+          "write_hits"]
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux and bytes on macOS. For RUSAGE_CHILDREN it is
+    # the largest finished child process, not their sum
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stage(stage, data_dir, params):
+    """Run one stage in the current process. Returns records, hits and seconds."""
+    from core import detection_logic
+    from core import hits_helpers
+
+    rule_set = detection_logic.RuleSet(synthetic_cloudtrail.rules(params["rules"]))
+    snares = detection_logic.SnareMatcher(synthetic_cloudtrail.snare_arns(params["snares"]))
+    filepaths = detection_logic.list_log_files(data_dir)
+    records = params["files"] * params["records"]
+    hits = 0
+
+    # Hits are printed to the console by the scan functions
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        if stage == "load_cloudtrail_file":
+            records = sum(
+                len(detection_logic.load_cloudtrail_file(filepath)) for filepath in filepaths
+            )
+        elif stage == "scan_file":
+            hits = sum(
+                detection_logic.scan_file(filepath, rule_set, snares) for filepath in filepaths
+            )
+        elif stage == "scan_directory":
+            hits = detection_logic.scan_directory(data_dir, rule_set, snares)
+        elif stage == "scan_directory_parallel":
+            hits = detection_logic.scan_directory(data_dir, rule_set, snares, params["workers"])
+        elif stage == "write_hits":
+            # Hits only: the records of the first file written over and over
+            events = detection_logic.load_cloudtrail_file(filepaths[0])
+            rule = rule_set.rules[0]
+            start = time.perf_counter()
+            with hits_helpers.HitWriter(output_dir) as writer:
+                for i in range(records):
+                    writer.write(rule, events[i % len(events)])
+            hits = records
+        else:
+            raise ValueError(f"unknown stage '{stage}'")
+        seconds = time.perf_counter() - start
+
+    return {"records": records, "hits": hits, "seconds": seconds}
+
+
+def _stage_process(stage, data_dir, params, queue):
+    result = run_stage(stage, data_dir, params)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result["workers_peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    queue.put(result)
+
+
+def measure(stage, data_dir, params):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_stage_process, args=(stage, data_dir, params, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    result["records_per_s"] = result["records"] / result["seconds"] if result["seconds"] else 0.0
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(params, results_file=RESULTS_FILE):
+    """The last stored run with the same parameters, if any."""
+    previous = None
+    try:
+        with open(results_file) as f:
+            for line in f:
+                run = json.loads(line)
+                if run.get("params") == params:
+                    previous = run
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def save_run(run, results_file=RESULTS_FILE):
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Detection throughput benchmark on synthetic CloudTrail logs"
+    )
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--records", type=int, default=2000, help="Records per file")
+    parser.add_argument("--hit-ratio", type=float, default=0.01,
+                        help="Fraction of records touching a snare")
+    parser.add_argument("--rules", type=int, default=10)
+    parser.add_argument("--snares", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Processes for scan_directory_parallel")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma separated stages to run")
+    parser.add_argument("--no-save", action="store_true",
+                        help="Do not append the results to the results file")
+    args = parser.parse_args()
+
+    params = {"files": args.files, "records": args.records, "hit_ratio": args.hit_ratio,
+              "rules": args.rules, "snares": args.snares, "workers": args.workers}
+    previous = previous_run(params)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        synthetic_cloudtrail.generate(
+            data_dir, args.files, args.records, args.hit_ratio,
+            synthetic_cloudtrail.snare_arns(args.snares), flat=True,
+        )
+
+        print(f"{args.files} files x {args.records} records, hit ratio {args.hit_ratio}, "
+              f"{args.rules} rules, {args.snares} snares\n")
+        print(f"{'stage':<24} {'records/s':>11} {'seconds':>8} {'hits':>7} "
+              f"{'peak MB':>8} {'workers MB':>10} {'vs last':>8}")
+        results = {}
+        for stage in args.stages.split(","):
+            result = measure(stage, data_dir, params)
+            results[stage] = result
+            change = ""
+            last = previous["results"].get(stage) if previous else None
+            if last and last["records_per_s"]:
+                change = f"{result['records_per_s'] / last['records_per_s'] - 1:+.0%}"
+            print(f"{stage:<24} {result['records_per_s']:>11.0f} {result['seconds']:>8.2f} "
+                  f"{result['hits']:>7} {result['peak_rss_mb']:>8.1f} "
+                  f"{result['workers_peak_rss_mb']:>10.1f} {change:>8}")
+
+    if previous:
+        print(f"\nCompared with {previous['commit']} ({previous['timestamp']})")
+    if not args.no_save:
+        save_run({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "params": params,
+            "results": results,
+        })
+        print(f"[+] Results appended to {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark LookupEvents polling against the local stub, with and without the token bucket.
+
+Without it, regions fire requests as fast as they can and lean on the SDK's
+throttling retries; with it, requests are paced to the quota. The poll time
+is the floor of the secret snare detection latency of `detect lookup`.
+
+Run from the repository root:
+    python -m benchmarks.bench_lookup_events
+    python -m benchmarks.bench_lookup_events --snares 40 --events 5000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import stub_lookup_events
+from benchmarks import synthetic_cloudtrail
+
+
+def poll(endpoint_url, snares, regions, rate):
+    from core import aws_cloudtrail_helpers
+
+    end = datetime.now(timezone.utc)
+    start_times = {region: end - timedelta(hours=1) for region in regions}
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        results = aws_cloudtrail_helpers.lookup_snare_events(
+            snares, regions, start_times, end, endpoint_url, rate
+        )
+    seconds = time.perf_counter() - start
+    failed = [region for region, records in results.items() if records is None]
+    return seconds, sum(len(records or []) for records in results.values()), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="LookupEvents polling benchmark against a local stub"
+    )
+    parser.add_argument("--snares", type=int, default=20,
+                        help="Secret snares, spread over the regions")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--hit-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # The stub accepts any credentials
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+
+    regions = synthetic_cloudtrail.REGIONS
+    arns = stub_lookup_events.secret_arns(args.snares, regions)
+    snares = [{"arn": arn, "region": arn.split(":")[3]} for arn in arns]
+    records = stub_lookup_events.generate_events(args.events, arns, args.hit_ratio, regions)
+
+    print(f"{args.snares} snares in {len(regions)} regions, {args.events} events\n")
+    print(f"{'client pacing':<22} {'poll s':>8} {'requests':>9} {'throttled':>10} "
+          f"{'events':>7} {'failed regions':>15}")
+    for name, rate in (("token bucket (2/s)", stub_lookup_events.RATE), ("none", 1000)):
+        stub = stub_lookup_events.StubLookupEvents(records)
+        server = stub_lookup_events.serve(stub)
+        try:
+            endpoint_url = f"http://127.0.0.1:{server.server_port}"
+            seconds, events, failed = poll(endpoint_url, snares, regions, rate)
+        finally:
+            server.shutdown()
+        print(f"{name:<22} {seconds:>8.2f} {stub.requests:>9} {stub.throttled:>10} "
+              f"{events:>7} {len(failed):>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark the raw-byte snare pre-screen against parsing every record, by snare hit ratio.
+
+Run from the repository root:
+    python -m benchmarks.bench_prescreen
+"""
+
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+from benchmarks import synthetic_cloudtrail
+from core import detection_logic
+
+HIT_RATIOS = [0.0, 0.0001, 0.001, 0.01, 0.1]
+REPEAT = 3
+
+
+def scan(filepaths, rule_set, snares, decoder):
+    detection_logic.set_decoder(decoder)
+    best, hits = float("inf"), 0
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            hits = sum(
+                detection_logic.scan_file(filepath, rule_set, snares) for filepath in filepaths
+            )
+        best = min(best, time.perf_counter() - start)
+    return best, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snare pre-screen benchmark")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--records", type=int, default=5000, help="Records per file")
+    parser.add_argument("--snares", type=int, default=100)
+    args = parser.parse_args()
+
+    arns = synthetic_cloudtrail.snare_arns(args.snares)
+    rule_set = detection_logic.RuleSet(synthetic_cloudtrail.rules(10))
+    snares = detection_logic.SnareMatcher(arns)
+    records = args.files * args.records
+
+    print(f"{args.files} files x {args.records} records, {args.snares} snares, "
+          f"decoder {detection_logic.Decoder()}\n")
+    print(f"{'hit ratio':>9} {'parse all rec/s':>16} {'prescreen rec/s':>16} "
+          f"{'speedup':>8} {'hits':>6}")
+    for hit_ratio in HIT_RATIOS:
+        with tempfile.TemporaryDirectory() as data_dir:
+            filepaths = synthetic_cloudtrail.generate(
+                data_dir, args.files, args.records, hit_ratio, arns, flat=True
+            )
+            full_time, full_hits = scan(
+                filepaths, rule_set, snares, detection_logic.Decoder(prescreen=False)
+            )
+            prescreen_time, prescreen_hits = scan(
+                filepaths, rule_set, snares, detection_logic.Decoder(prescreen=True)
+            )
+        assert full_hits == prescreen_hits, (full_hits, prescreen_hits)
+        print(f"{hit_ratio:>9} {records / full_time:>16.0f} {records / prescreen_time:>16.0f} "
+              f"{full_time / prescreen_time:>7.1f}x {prescreen_hits:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark rule matching throughput as the number of detection rules grows.
+
+Run from the repository root:
+    python -m benchmarks.bench_rule_index
+"""
+
+import random
+import time
+
+from core import detection_logic
+
+EVENT_SOURCES = ["s3.amazonaws.com", "secretsmanager.amazonaws.com", "iam.amazonaws.com",
+                 "ec2.amazonaws.com", "sts.amazonaws.com", "kms.amazonaws.com"]
+SNARE_ARN = "arn:aws:s3:::secret-prod-store-42"
+RULE_COUNTS = [2, 10, 100, 1000]
+EVENT_COUNT = 20000
+
+
+def make_rules(count):
+    """Generate `count` rules spread over sources and event names."""
+    rules = [
+        {"name": "S3_download_file", "description": "",
+         "logic": {"eventSource": "s3.amazonaws.com", "eventName": "GetObject"}},
+        {"name": "SecretsManager_secret_reveal", "description": "",
+         "logic": {"eventSource": "secretsmanager.amazonaws.com", "eventName": "GetSecretValue"}},
+    ]
+    for i in range(count - len(rules)):
+        rules.append({
+            "name": f"rule_{i}",
+            "description": "",
+            "logic": {"eventSource": random.choice(EVENT_SOURCES), "eventName": f"Action{i}"},
+        })
+    return rules[:count]
+
+
+def make_events(count):
+    """Generate events that mostly touch the snare with common event names."""
+    events = []
+    for i in range(count):
+        events.append({
+            "eventSource": random.choice(EVENT_SOURCES),
+            "eventName": random.choice(
+                ["GetObject", "GetSecretValue", "PutObject", f"Action{i % 50}"]
+            ),
+            "resources": [{"ARN": SNARE_ARN}],
+        })
+    return events
+
+
+def run():
+    random.seed(1)
+    events = make_events(EVENT_COUNT)
+    print(f"{'rules':>6} {'events/s':>12} {'hits':>8}")
+    for rule_count in RULE_COUNTS:
+        rule_set = detection_logic.RuleSet(make_rules(rule_count))
+        snares = detection_logic.SnareMatcher([SNARE_ARN])
+        hits = 0
+        start = time.perf_counter()
+        for event in events:
+            if not snares.matches(event):
+                continue
+            for _ in rule_set.matching(event):
+                hits += 1
+        elapsed = time.perf_counter() - start
+        print(f"{rule_count:>6} {EVENT_COUNT / elapsed:>12.0f} {hits:>8}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,102 @@
+"""Benchmark compiled rule predicates against per-event interpretation of the rule logic.
+
+Run from the repository root:
+    python -m benchmarks.bench_rule_predicates
+"""
+
+import random
+import time
+
+from core import detection_logic
+from benchmarks import bench_rule_index
+from benchmarks.bench_rule_index import make_rules
+
+RULE_COUNTS = [2, 10, 100, 1000]
+EVENT_COUNT = 20000
+REPEAT = 5
+
+EXTENDED_RULES = [
+    {"name": "S3_download_by_user", "description": "", "logic": {
+        "eventSource": "s3.amazonaws.com",
+        "eventName": ["GetObject", "HeadObject"],
+        "userIdentity.arn": {"prefix": "arn:aws:iam::111111111111:user/"},
+        "requestParameters.key": {"wildcard": "backups/*.sql"},
+        "userAgent": {"not": {"regex": "^aws-internal"}},
+    }},
+    {"name": "Secret_read_in_window", "description": "", "logic": {
+        "eventSource": "secretsmanager.amazonaws.com",
+        "eventName": "GetSecretValue",
+        "eventTime": {"gte": "2024-05-01T00:00:00Z", "lt": "2024-06-01T00:00:00Z"},
+    }},
+]
+
+
+def interpreted_matches_rule(event, logic):
+    """Top-level equality / membership check as done before rules were compiled."""
+    for field, expected in logic.items():
+        value = event.get(field)
+        if isinstance(expected, list):
+            if value not in expected:
+                return False
+        else:
+            if value != expected:
+                return False
+    return True
+
+
+def make_events(count):
+    """The events of bench_rule_index, plus the fields the extended rules look at."""
+    events = bench_rule_index.make_events(count)
+    for i, event in enumerate(events):
+        event.update({
+            "eventTime": f"2024-05-{random.randint(1, 31):02}T12:00:00Z",
+            "userAgent": random.choice(["aws-cli/2.15", "aws-internal/3", "Boto3/1.34"]),
+            "userIdentity": {"arn": f"arn:aws:iam::111111111111:user/u{i % 7}"},
+            "requestParameters": {"key": random.choice(["backups/db.sql", "docs/readme.txt"])},
+        })
+    return events
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        hits = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), hits
+
+
+def run():
+    random.seed(1)
+    events = make_events(EVENT_COUNT)
+
+    print("Equality rules (the grammar every rule used before):")
+    print(f"{'rules':>6} {'interpreted ev/s':>17} {'compiled ev/s':>14} {'hits':>8}")
+    for rule_count in RULE_COUNTS:
+        rule_set = detection_logic.RuleSet(make_rules(rule_count))
+
+        def interpreted(rule_set=rule_set):
+            return sum(
+                1
+                for event in events
+                for rule in rule_set.candidates(event)
+                if interpreted_matches_rule(event, rule["logic"])
+            )
+
+        def compiled(rule_set=rule_set):
+            return sum(1 for event in events for _ in rule_set.matching(event))
+
+        interpreted_time, interpreted_hits = best_of(interpreted)
+        compiled_time, compiled_hits = best_of(compiled)
+        assert interpreted_hits == compiled_hits
+        print(f"{rule_count:>6} {EVENT_COUNT / interpreted_time:>17.0f} "
+              f"{EVENT_COUNT / compiled_time:>14.0f} {compiled_hits:>8}")
+
+    print("\nExtended rules (nested paths, wildcard, regex, negation, time window):")
+    rule_set = detection_logic.RuleSet(EXTENDED_RULES)
+    elapsed, hits = best_of(lambda: sum(1 for event in events for _ in rule_set.matching(event)))
+    print(f"{len(EXTENDED_RULES):>6} {EVENT_COUNT / elapsed:>17.0f} ev/s {hits:>8} hits")
+
+
+if __name__ == "__main__":
+    run()
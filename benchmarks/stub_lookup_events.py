@@ -0,0 +1,207 @@
+"""Local stub of the CloudTrail LookupEvents API, serving synthetic events offline.
+
+It enforces the real quota (2 requests per second per region) by answering
+with ThrottlingException. Point `detect lookup` at it with --endpoint-url
+(any credentials work). The stub's snares belong to the configured account.
+`detect lookup` only queries snares in the local snare registry, so pass
+--register to add them there. That changes the real registry (and with it
+the scan checkpoint fingerprint), so only do it in a scratch checkout.
+
+Run from the repository root:
+    python -m benchmarks.stub_lookup_events --port 8787 --snares 10 --events 2000 --register
+    python cli.py detect lookup --endpoint-url http://127.0.0.1:8787 --iterations 1
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Sequence
+
+from benchmarks import synthetic_cloudtrail
+
+PAGE_SIZE = 50
+RATE = 2
+
+_REGION_PATTERN = re.compile(r"Credential=[^/]+/\d+/([^/]+)/")
+
+
+def secret_arns(count: int, regions: Sequence[str] = synthetic_cloudtrail.REGIONS,
+                account_id: str = synthetic_cloudtrail.ACCOUNT_ID) -> List[str]:
+    return [
+        f"arn:aws:secretsmanager:{regions[i % len(regions)]}:{account_id}"
+        f":secret:snare-secret-{i:05}-AbCdEf"
+        for i in range(count)
+    ]
+
+
+def generate_events(count: int, snares: List[str], hit_ratio: float,
+                    regions: Sequence[str] = synthetic_cloudtrail.REGIONS, seed: int = 1,
+                    account_id: str = synthetic_cloudtrail.ACCOUNT_ID) -> List[Dict[str, Any]]:
+    """Management event records of the last hour, hits reading one of the snares in its region."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    records = []
+    for _ in range(count):
+        event_time = now - timedelta(seconds=rng.randint(0, 3599))
+        hit = rng.random() < hit_ratio
+        if hit:
+            snare = rng.choice(snares)
+            records.append(synthetic_cloudtrail.make_record(
+                rng, event_time, snare.split(":")[3], [snare], True, account_id
+            ))
+        else:
+            records.append(synthetic_cloudtrail.make_record(
+                rng, event_time, rng.choice(regions), [], False, account_id
+            ))
+    return records
+
+
+def _resource_names(record: Dict[str, Any]) -> List[str]:
+    """What CloudTrail extracts as the resources of an event, roughly."""
+    names = [resource["ARN"] for resource in record.get("resources") or [] if resource.get("ARN")]
+    parameters = record.get("requestParameters")
+    if isinstance(parameters, dict) and parameters.get("secretId"):
+        names.append(parameters["secretId"])
+    return names
+
+
+class StubLookupEvents:
+    """LookupEvents over a fixed set of records, with per-region throttling and request counts."""
+
+    def __init__(self, records: List[Dict[str, Any]], rate: float = RATE):
+        self.rate = rate
+        self.requests = 0
+        self.throttled = 0
+        self._by_region = defaultdict(list)
+        for record in sorted(records, key=lambda record: record["eventTime"], reverse=True):
+            self._by_region[record["awsRegion"]].append(record)
+        # Token bucket per region, like the API's: (tokens, last update)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, region: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            tokens, updated = self._buckets.get(region, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[region] = (tokens, now)
+                self.throttled += 1
+                return False
+            self._buckets[region] = (tokens - 1, now)
+            return True
+
+    def lookup(self, region: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        attributes = {
+            attribute["AttributeKey"]: attribute["AttributeValue"]
+            for attribute in request.get("LookupAttributes", [])
+        }
+        start = request.get("StartTime", 0)
+        end = request.get("EndTime", float("inf"))
+        matches = []
+        for record in self._by_region[region]:
+            event_time = datetime.fromisoformat(
+                record["eventTime"].replace("Z", "+00:00")
+            ).timestamp()
+            if not start <= event_time <= end:
+                continue
+            if ("ResourceName" in attributes
+                    and attributes["ResourceName"] not in _resource_names(record)):
+                continue
+            if "EventName" in attributes and attributes["EventName"] != record["eventName"]:
+                continue
+            matches.append((event_time, record))
+
+        offset = int(request.get("NextToken") or 0)
+        page_size = min(request.get("MaxResults") or PAGE_SIZE, PAGE_SIZE)
+        page = matches[offset:offset + page_size]
+        response = {"Events": [{
+            "EventId": record["eventID"],
+            "EventName": record["eventName"],
+            "EventTime": event_time,
+            "EventSource": record["eventSource"],
+            "Resources": [{"ResourceName": name} for name in _resource_names(record)],
+            "CloudTrailEvent": json.dumps(record),
+        } for event_time, record in page]}
+        if offset + page_size < len(matches):
+            response["NextToken"] = str(offset + page_size)
+        return response
+
+
+def serve(stub: StubLookupEvents, port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub on 127.0.0.1 in a background thread. Port 0 picks a free port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            match = _REGION_PATTERN.search(self.headers.get("Authorization", ""))
+            region = match.group(1) if match else "us-east-1"
+            if not self.headers.get("X-Amz-Target", "").endswith(".LookupEvents"):
+                self._reply(400, {"__type": "UnsupportedOperationException",
+                                  "message": "Only LookupEvents is stubbed"})
+            elif not stub.allow(region):
+                self._reply(400, {"__type": "ThrottlingException", "message": "Rate exceeded"})
+            else:
+                self._reply(200, stub.lookup(region, request))
+
+        def _reply(self, status: int, body: Dict[str, Any]):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-amz-json-1.1")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CloudTrail LookupEvents stub")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--snares", type=int, default=10, help="Number of secret snares")
+    parser.add_argument("--events", type=int, default=2000,
+                        help="Management events in the last hour")
+    parser.add_argument("--hit-ratio", type=float, default=0.05,
+                        help="Fraction of events reading a snare")
+    parser.add_argument("--register", action="store_true",
+                        help="Add the snares to the local snare registry for 'detect lookup'")
+    args = parser.parse_args()
+
+    from core import config_helpers
+    settings = config_helpers.load_settings()
+    account_id = settings.get("AWS_account_id") or synthetic_cloudtrail.ACCOUNT_ID
+    regions = settings.get("AWS_configured_regions") or synthetic_cloudtrail.REGIONS
+
+    snares = secret_arns(args.snares, regions, account_id)
+    stub = StubLookupEvents(
+        generate_events(args.events, snares, args.hit_ratio, regions, account_id=account_id)
+    )
+    if args.register:
+        from core import snare_registry_helpers
+        snare_registry_helpers.add_snares([{"arn": arn} for arn in snares])
+    server = serve(stub, args.port)
+    print(f"[+] LookupEvents stub on http://127.0.0.1:{server.server_port} with {args.events} "
+          f"events and {args.snares} snares (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n[+] {stub.requests} requests, {stub.throttled} throttled")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Generate synthetic, realistic gzipped CloudTrail logs for offline benchmarks.
+
+Files are written in the S3 key layout CloudTrail uses,
+AWSLogs/<account>/CloudTrail/<region>/YYYY/MM/DD/<file>.json.gz, or flat in
+one directory like `detect run-local` downloads them.
+
+Run from the repository root:
+    python -m benchmarks.synthetic_cloudtrail OUTPUT_DIR --files 10 --records 1000 --hit-ratio 0.01
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, Any, Sequence
+
+ACCOUNT_ID = "123456789012"
+REGIONS = ("us-east-1", "eu-central-1", "eu-west-1", "ap-southeast-2")
+
+USER_AGENTS = [
+    "aws-cli/2.15.30 Python/3.11.8 Linux/6.5.0 exe/x86_64.ubuntu.22",
+    "Boto3/1.34.69 md/Botocore#1.34.69 ua/2.0 os/linux#6.5.0 lang/python#3.12.2",
+    "aws-sdk-go-v2/1.25.3 os/linux lang/go#1.22.1",
+    "console.amazonaws.com",
+    "AWS Internal",
+]
+
+# (eventSource, eventName, readOnly) of ordinary background activity
+BACKGROUND_CALLS = [
+    ("sts.amazonaws.com", "AssumeRole", True),
+    ("sts.amazonaws.com", "GetCallerIdentity", True),
+    ("ec2.amazonaws.com", "DescribeInstances", True),
+    ("ec2.amazonaws.com", "DescribeVolumes", True),
+    ("iam.amazonaws.com", "ListRoles", True),
+    ("kms.amazonaws.com", "Decrypt", True),
+    ("kms.amazonaws.com", "GenerateDataKey", True),
+    ("s3.amazonaws.com", "GetObject", True),
+    ("s3.amazonaws.com", "PutObject", False),
+    ("s3.amazonaws.com", "ListObjects", True),
+    ("secretsmanager.amazonaws.com", "GetSecretValue", True),
+    ("lambda.amazonaws.com", "Invoke", False),
+    ("logs.amazonaws.com", "CreateLogStream", False),
+]
+
+
+def snare_arns(count: int, account_id: str = ACCOUNT_ID) -> List[str]:
+    """Snare ARNs, alternating S3 buckets and secrets."""
+    arns = []
+    for i in range(count):
+        if i % 2 == 0:
+            arns.append(f"arn:aws:s3:::snare-bucket-{i:05}")
+        else:
+            region = REGIONS[i % len(REGIONS)]
+            suffix = uuid.UUID(int=i).hex[:6]
+            arns.append(
+                f"arn:aws:secretsmanager:{region}:{account_id}:secret:snare-secret-{i:05}-{suffix}"
+            )
+    return arns
+
+
+def rules(count: int) -> List[Dict[str, Any]]:
+    """The shipped detection rules plus filler rules up to `count`."""
+    generated = [
+        {"name": "S3_download_file",
+         "description": "Detect when file is downloaded from the S3 bucket.",
+         "logic": {"eventSource": "s3.amazonaws.com", "eventName": "GetObject"}},
+        {"name": "SecretsManager_secret_reveal",
+         "description": "Detect when an AWS secret is retrieved.",
+         "logic": {"eventSource": "secretsmanager.amazonaws.com", "eventName": "GetSecretValue"}},
+    ]
+    for i in range(count - len(generated)):
+        source, name, _ = BACKGROUND_CALLS[i % len(BACKGROUND_CALLS)]
+        generated.append({"name": f"synthetic_rule_{i}", "description": "Synthetic rule.",
+                          "logic": {"eventSource": source, "eventName": f"{name}{i}"}})
+    return generated[:count]
+
+
+def _identity(rng: random.Random, account_id: str) -> Dict[str, Any]:
+    user = f"user-{rng.randint(1, 40):02}"
+    if rng.random() < 0.6:
+        return {
+            "type": "IAMUser",
+            "principalId": f"AIDA{rng.getrandbits(64):016X}",
+            "arn": f"arn:aws:iam::{account_id}:user/{user}",
+            "accountId": account_id,
+            "accessKeyId": f"AKIA{rng.getrandbits(64):016X}",
+            "userName": user,
+        }
+    role = f"role-{rng.randint(1, 15):02}"
+    return {
+        "type": "AssumedRole",
+        "principalId": f"AROA{rng.getrandbits(64):016X}:{user}",
+        "arn": f"arn:aws:sts::{account_id}:assumed-role/{role}/{user}",
+        "accountId": account_id,
+        "accessKeyId": f"ASIA{rng.getrandbits(64):016X}",
+        "sessionContext": {
+            "sessionIssuer": {"type": "Role", "principalId": f"AROA{rng.getrandbits(64):016X}",
+                              "arn": f"arn:aws:iam::{account_id}:role/{role}",
+                              "accountId": account_id, "userName": role},
+            "attributes": {"creationDate": "2024-05-01T08:00:00Z", "mfaAuthenticated": "false"},
+        },
+    }
+
+
+def make_record(rng: random.Random, event_time: datetime, region: str, snares: List[str],
+                hit: bool, account_id: str = ACCOUNT_ID) -> Dict[str, Any]:
+    """One CloudTrail record. With hit set it reads a snare bucket object or secret."""
+    if hit and snares:
+        snare = rng.choice(snares)
+        if snare.startswith("arn:aws:s3:::"):
+            source, name, read_only = "s3.amazonaws.com", "GetObject", True
+        else:
+            source, name, read_only = "secretsmanager.amazonaws.com", "GetSecretValue", True
+    else:
+        snare = None
+        source, name, read_only = rng.choice(BACKGROUND_CALLS)
+
+    record = {
+        "eventVersion": "1.09",
+        "userIdentity": _identity(rng, account_id),
+        "eventTime": event_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "eventSource": source,
+        "eventName": name,
+        "awsRegion": region,
+        "sourceIPAddress": (f"{rng.randint(1, 223)}.{rng.randint(0, 255)}."
+                            f"{rng.randint(0, 255)}.{rng.randint(1, 254)}"),
+        "userAgent": rng.choice(USER_AGENTS),
+        "requestParameters": None,
+        "responseElements": None,
+        "requestID": uuid.UUID(int=rng.getrandbits(128)).hex.upper()[:16],
+        "eventID": str(uuid.UUID(int=rng.getrandbits(128))),
+        "readOnly": read_only,
+        "eventType": "AwsApiCall",
+        "managementEvent": source not in ("s3.amazonaws.com",),
+        "recipientAccountId": account_id,
+        "eventCategory": "Data" if source == "s3.amazonaws.com" else "Management",
+        "tlsDetails": {"tlsVersion": "TLSv1.3", "cipherSuite": "TLS_AES_128_GCM_SHA256",
+                       "clientProvidedHostHeader":
+                           f"{source.split('.')[0]}.{region}.amazonaws.com"},
+    }
+
+    if source == "s3.amazonaws.com":
+        bucket = snare[len("arn:aws:s3:::"):] if snare else f"app-data-{rng.randint(1, 30):02}"
+        key = f"exports/{rng.randint(1, 99999):05}.csv"
+        record["requestParameters"] = {
+            "bucketName": bucket, "Host": f"{bucket}.s3.{region}.amazonaws.com", "key": key,
+        }
+        record["additionalEventData"] = {
+            "bytesTransferredIn": 0, "bytesTransferredOut": rng.randint(100, 10 ** 6),
+        }
+        record["resources"] = [
+            {"type": "AWS::S3::Object", "ARN": f"arn:aws:s3:::{bucket}/{key}"},
+            {"accountId": account_id, "type": "AWS::S3::Bucket", "ARN": f"arn:aws:s3:::{bucket}"},
+        ]
+    elif source == "secretsmanager.amazonaws.com":
+        secret_name = f"app-{rng.randint(1, 30):02}-AbCdEf"
+        secret_id = snare or f"arn:aws:secretsmanager:{region}:{account_id}:secret:{secret_name}"
+        record["requestParameters"] = {"secretId": secret_id}
+    elif source == "ec2.amazonaws.com":
+        record["requestParameters"] = {"maxResults": 1000, "filterSet": {}}
+    return record
+
+
+def write_log_file(path: str, records: List[Dict[str, Any]]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"Records": records}, f)
+
+
+def generate(output_dir: str, files: int = 10, records_per_file: int = 1000,
+             hit_ratio: float = 0.01, snares: Sequence[str] = (),
+             regions: Sequence[str] = REGIONS, day: date = date(2024, 5, 1), flat: bool = False,
+             seed: int = 1, account_id: str = ACCOUNT_ID) -> List[str]:
+    """Write `files` gzipped CloudTrail logs and return their paths.
+
+    hit_ratio: fraction of records that touch one of the snares
+    flat: write all files into output_dir instead of the AWSLogs/... layout
+    """
+    rng = random.Random(seed)
+    snares = list(snares)
+    paths = []
+    for i in range(files):
+        region = regions[i % len(regions)]
+        start = (datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+                 + timedelta(minutes=5 * (i // len(regions))))
+        file_id = uuid.UUID(int=rng.getrandbits(128)).hex[:16]
+        filename = f"{account_id}_CloudTrail_{region}_{start:%Y%m%dT%H%MZ}_{file_id}.json.gz"
+        if flat:
+            path = os.path.join(output_dir, filename)
+        else:
+            path = os.path.join(output_dir, "AWSLogs", account_id, "CloudTrail", region,
+                                f"{start:%Y}", f"{start:%m}", f"{start:%d}", filename)
+
+        records = [
+            make_record(rng, start + timedelta(seconds=rng.randint(0, 299)), region, snares,
+                        rng.random() < hit_ratio, account_id)
+            for _ in range(records_per_file)
+        ]
+        records.sort(key=lambda record: record["eventTime"])
+        write_log_file(path, records)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic CloudTrail logs")
+    parser.add_argument("output_dir")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--records", type=int, default=1000, help="Records per file")
+    parser.add_argument("--hit-ratio", type=float, default=0.01,
+                        help="Fraction of records touching a snare")
+    parser.add_argument("--snares", type=int, default=10, help="Number of snare ARNs")
+    parser.add_argument("--rules", type=int, default=2,
+                        help="Number of detection rules written to detection_rules.yaml")
+    parser.add_argument("--flat", action="store_true",
+                        help="Write all files into one directory like 'detect run-local'")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import yaml
+
+    arns = snare_arns(args.snares)
+    paths = generate(args.output_dir, args.files, args.records, args.hit_ratio, arns,
+                     flat=args.flat, seed=args.seed)
+    with open(os.path.join(args.output_dir, "snares.json"), "w") as f:
+        json.dump(arns, f, indent=2)
+    with open(os.path.join(args.output_dir, "detection_rules.yaml"), "w") as f:
+        yaml.safe_dump({"rules": rules(args.rules)}, f, sort_keys=False)
+    print(f"[+] Wrote {len(paths)} files with {args.records} records each to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,48 +2,70 @@
 
 import argparse
 
-from core import aws_s3_helpers  # Importing the helper functions
-from core import aws_secret_helpers
-from core import aws_cloudtrail_helpers
-from core import config_helpers
-
 # -----------------------------
 # Handlers for each command
 # -----------------------------
+# Helper modules are imported inside the handlers, so commands that don't
+# talk to AWS (config, --help) start without importing boto3.
 
 def handle_get(args):
-    if args.resource == "S3":
-        aws_s3_helpers.get_s3_bucket_names()
+    if args.local:
+        from core import snare_registry_helpers
+        for snare in snare_registry_helpers.list_snares(args.resource, account_id=args.account):
+            print(f"- {snare['name']} ({snare['region'] or 'global'}): {snare['arn']}")
+    elif args.resource == "S3":
+        from core import aws_s3_helpers
+        aws_s3_helpers.get_s3_bucket_names(args.refresh)
     elif args.resource == "secret":
+        from core import aws_secret_helpers
         aws_secret_helpers.get_secrets_names()
     elif args.resource == "cloudtrail":
+        from core import aws_cloudtrail_helpers
         aws_cloudtrail_helpers.get_cloudtrail_trail_names()
     else:
         print(f"Unsupported resource for get: {args.resource}")
 
 def handle_create(args):
+    if args.count:
+        from core import aws_session_helpers
+        regions = aws_session_helpers.resolve_regions(args.regions)
+
     if args.resource == "S3":
-        aws_s3_helpers.create_s3_bucket(snare=True)
+        from core import aws_s3_helpers
+        if args.count:
+            aws_s3_helpers.create_s3_buckets_bulk(args.count, regions)
+        else:
+            aws_s3_helpers.create_s3_bucket(snare=True)
     elif args.resource == "secret":
-        aws_secret_helpers.create_secret(snare=True)
+        from core import aws_secret_helpers
+        if args.count:
+            aws_secret_helpers.create_secrets_bulk(args.count, regions)
+        else:
+            aws_secret_helpers.create_secret(snare=True)
     else:
         print(f"Unsupported resource for create: {args.resource}")
 
 def handle_upload(args):
     if args.resource == "S3":
+        from core import aws_s3_helpers
         bucket_name = input("S3 bucket name to upload to: ").strip()
         aws_s3_helpers.upload_snare_data(bucket_name)
     else:
         print(f"Unsupported resource for create: {args.resource}")
 
 def handle_delete(args):
-    if args.resource == "s3":
-        print("Deleting S3 resource...")
-        # your_function_to_delete_s3()
+    if args.resource == "S3":
+        from core import aws_s3_helpers
+        aws_s3_helpers.delete_s3_bucket()
+    elif args.resource == "secret":
+        from core import aws_secret_helpers
+        aws_secret_helpers.delete_secret()
     else:
         print(f"Unsupported resource for delete: {args.resource}")
 
 def handle_config(args):
+    from core import config_helpers
+
     if args.setting == "show":
         config_helpers.config_print()
     elif args.setting == "def_reg":
@@ -56,14 +78,76 @@ def handle_config(args):
         print(f"Unsupported setting for config: {args.setting}")
 
 def handle_detect(args):
+    from core import aws_cloudtrail_helpers
+
+    aggregation = None
+    if args.aggregate:
+        aggregation = {"key_fields": args.aggregate_by.split(","), "window": args.aggregate_window}
+
+    if args.json_backend != "auto" or args.gzip_backend != "auto" or args.no_prescreen:
+        from core import detection_logic
+        detection_logic.set_decoder(
+            detection_logic.Decoder(args.json_backend, args.gzip_backend, not args.no_prescreen)
+        )
+
+    if args.stats or args.metrics_file:
+        from core import stats_helpers
+        stats_helpers.STATS.enable()
+
+    cache_bytes = None if args.cache_mb is None else args.cache_mb * 1024 * 1024
+
     if args.method == "setup":
         aws_cloudtrail_helpers.create_cloudtrail_trail()
     elif args.method == "update":
         aws_cloudtrail_helpers.update_selectors()
     elif args.method == "run-local":
-        aws_cloudtrail_helpers.detect_cloudtrail_events_locally()
+        aws_cloudtrail_helpers.detect_cloudtrail_events_locally(
+            args.workers or 1, args.full_rescan, args.compress, args.ingest, aggregation,
+            cache_bytes,
+        )
+    elif args.method == "run-stream":
+        aws_cloudtrail_helpers.detect_cloudtrail_events_streaming(
+            args.workers, args.full_rescan, args.compress, aggregation, cache_bytes,
+        )
+    elif args.method == "watch":
+        aws_cloudtrail_helpers.watch_cloudtrail_events(
+            args.interval or 300, args.workers, args.iterations, compression=args.compress,
+            aggregation=aggregation, metrics_file=args.metrics_file,
+        )
+    elif args.method == "lookup":
+        aws_cloudtrail_helpers.lookup_cloudtrail_events(
+            args.interval or 60, args.iterations, args.lookback * 60, args.endpoint_url,
+            compression=args.compress, aggregation=aggregation, metrics_file=args.metrics_file,
+        )
     else:
         print(f"Unsupported values for detect: {args.method}")
+        return
+
+    if args.method in ("run-local", "run-stream"):
+        if args.stats:
+            stats_helpers.STATS.print_summary()
+        if args.metrics_file:
+            stats_helpers.STATS.write_prometheus(args.metrics_file)
+
+def handle_query(args):
+    from core import event_store_helpers
+
+    if args.method == "ingest":
+        event_store_helpers.ingest_directory()
+    elif args.method == "events":
+        count = 0
+        events = event_store_helpers.query_events(
+            args.event_name, args.principal, args.resource, args.since, args.until, args.limit
+        )
+        for event in events:
+            count += 1
+            print(f"{event.get('eventTime')} {event.get('eventSource')} {event.get('eventName')} "
+                  f"{(event.get('userIdentity') or {}).get('arn')} {event.get('sourceIPAddress')}")
+        print(f"[+] {count} events")
+    elif args.method == "hunt":
+        event_store_helpers.retro_hunt(args.since, args.until)
+    else:
+        print(f"Unsupported values for query: {args.method}")
 
 # -----------------------------
 # CLI Setup
@@ -78,11 +162,25 @@ def main():
     # Get command
     get_parser = subparsers.add_parser('get', help="List existing snares")
     get_parser.add_argument('resource', choices = aws_resource_types, help="Snare type to list")
+    get_parser.add_argument(
+        '--refresh', action='store_true',
+        help="Ignore the cached S3 snare inventory",
+    )
+    get_parser.add_argument(
+        '--local', action='store_true',
+        help="List snares from the local snare registry instead of AWS",
+    )
+    get_parser.add_argument('--account', help="With --local, only list snares of this account id")
     get_parser.set_defaults(func=handle_get)
 
     # Create command
     create_parser = subparsers.add_parser('create', help="Create a new snare")
     create_parser.add_argument('resource', choices = aws_resource_types, help="Snare type to create")
+    create_parser.add_argument('--count', type=int, help="Create this many snares without prompts")
+    create_parser.add_argument(
+        '--regions', default="all",
+        help="Regions for --count: 'all' configured regions or a comma separated list",
+    )
     create_parser.set_defaults(func=handle_create)
 
     # Upload
@@ -102,9 +200,107 @@ def main():
 
     # detect command
     config_parser = subparsers.add_parser('detect', help="Detect activity in the snares")
-    config_parser.add_argument('method', choices=['setup','update','run-local'], help="Detection method")
+    config_parser.add_argument(
+        'method', choices=['setup','update','run-local','run-stream','watch','lookup'],
+        help="Detection method",
+    )
+    config_parser.add_argument(
+        '--workers', type=int,
+        help="Number of processes (run-local) or threads (run-stream, watch) "
+             "used to scan log files",
+    )
+    config_parser.add_argument(
+        '--full-rescan', action='store_true',
+        help="Ignore the scan checkpoint and rescan all log files (run-local, run-stream)",
+    )
+    config_parser.add_argument(
+        '--interval', type=int,
+        help="Seconds between polls (watch: 300, lookup: 60)",
+    )
+    config_parser.add_argument(
+        '--iterations', type=int,
+        help="Stop after this many polls (watch, lookup; default: run until stopped)",
+    )
+    config_parser.add_argument(
+        '--lookback', type=int, default=60,
+        help="Minutes of events queried on the first poll (lookup)",
+    )
+    config_parser.add_argument(
+        '--endpoint-url',
+        help="CloudTrail API endpoint, e.g. a local stub (lookup)",
+    )
+    config_parser.add_argument(
+        '--compress', choices=['gzip', 'zstd'],
+        help="Compress the NDJSON hits output",
+    )
+    config_parser.add_argument(
+        '--aggregate', action='store_true',
+        help="Report repeated hits once, followed by a summary with counts and first/last seen",
+    )
+    config_parser.add_argument(
+        '--aggregate-by', default="rule,principal,sourceIP,snare",
+        help="Comma separated fields grouping repeated hits: rule, snare, principal, "
+             "sourceIP, account or event paths",
+    )
+    config_parser.add_argument(
+        '--aggregate-window', type=int, default=3600,
+        help="Seconds of event time a group of repeated hits stays open",
+    )
+    config_parser.add_argument(
+        '--stats', action='store_true',
+        help="Print per-stage timings, record counts and per-rule hits after the run "
+             "(run-local, run-stream)",
+    )
+    config_parser.add_argument(
+        '--metrics-file',
+        help="Write the run's stats in Prometheus textfile format to this path (after every "
+             "poll for watch)",
+    )
+    config_parser.add_argument(
+        '--json-backend', choices=['auto', 'stdlib', 'orjson'], default='auto',
+        help="JSON decoder for log files (auto uses orjson when installed)",
+    )
+    config_parser.add_argument(
+        '--gzip-backend', choices=['auto', 'stdlib', 'isal'], default='auto',
+        help="gzip decompressor for log files (auto uses python-isal when installed)",
+    )
+    config_parser.add_argument(
+        '--no-prescreen', action='store_true',
+        help="Parse every record instead of only those whose raw bytes mention a snare",
+    )
+    config_parser.add_argument(
+        '--ingest', action='store_true',
+        help="Also load the downloaded logs into the local event store (run-local)",
+    )
+    config_parser.add_argument(
+        '--cache-mb', type=int,
+        help="Size budget in MB of the local cache of downloaded log files, 0 disables it "
+             "(run-local: 2048; run-stream: only used when given)",
+    )
     config_parser.set_defaults(func=handle_detect)
 
+    # query command
+    query_parser = subparsers.add_parser(
+        'query', help="Query the local event store of downloaded CloudTrail logs"
+    )
+    query_parser.add_argument(
+        'method', choices=['ingest', 'events', 'hunt'],
+        help="Load downloaded logs, list stored events or re-run the rules over them",
+    )
+    query_parser.add_argument(
+        '--since',
+        help="Only events at or after this ISO 8601 time, e.g. 2024-05-01T00:00:00Z",
+    )
+    query_parser.add_argument('--until', help="Only events before this ISO 8601 time")
+    query_parser.add_argument('--event-name', help="Only events with this eventName (events)")
+    query_parser.add_argument('--principal', help="Only events by this principal ARN (events)")
+    query_parser.add_argument(
+        '--resource',
+        help="Only events touching this resource ARN, bucket ARN or secret id (events)",
+    )
+    query_parser.add_argument('--limit', type=int, help="Maximum number of events to list (events)")
+    query_parser.set_defaults(func=handle_query)
+
     # Parse and dispatch
     args = parser.parse_args()
     args.func(args)
@@ -1,76 +1,449 @@
 import boto3
 from botocore.exceptions import ClientError
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta, datetime, timezone
+import json
+import signal
+import sys
+import time
 import uuid
 
 from core import config_helpers
 from core import aws_s3_helpers
 from core import detection_logic
+from core import checkpoint_helpers
+from core import aws_session_helpers
+from core import snare_registry_helpers
+from core import hits_helpers
+from core import object_cache_helpers
+from core import stats_helpers
 
-default_region = config_helpers.default_region_get()
-all_regions = config_helpers.regions_get()
-AWSnare_tag = config_helpers.AWSnare_tag_get()
-cloudtrail_trail_name = config_helpers.cloudtrail_name_get()
-account_id = config_helpers.account_id_get()
+# Maximum number of trail ARNs accepted by a single ListTags call
+LIST_TAGS_BATCH_SIZE = 20
+
+# LookupEvents allows 2 requests per second per account and region
+LOOKUP_EVENTS_RATE = 2
+
+# Seconds before the end of the previous poll that are queried again, for
+# events that show up late in LookupEvents
+LOOKUP_OVERLAP = 900
+
+# Snares whose reads are management events; S3 object reads are data
+# events, which LookupEvents does not return
+LOOKUP_RESOURCE_TYPES = ("secret",)
 
 def get_cloudtrail_trail_names():
     """Retrieve a list of Cloudtrail trails"""
 
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+    all_regions = config_helpers.regions_get()
+
     print(f"[+] Fetching Cloudtrail trails with tag: '{AWSnare_tag}'...")
 
-    for region_name in all_regions:
-        client = boto3.client('cloudtrail',region_name=region_name)
+    def region_trails(region_name):
+        client = aws_session_helpers.get_client('cloudtrail', region_name)
+        trails = [
+            trail
+            for page in client.get_paginator('list_trails').paginate()
+            for trail in page['Trails']
+        ]
+
+        # Tags are read in the trail's home region, up to 20 trails per call
+        tagged_arns = set()
+        errors = []
+        by_home_region = {}
+        for trail in trails:
+            by_home_region.setdefault(trail['HomeRegion'], []).append(trail['TrailARN'])
+        for home_region, trail_ARNs in by_home_region.items():
+            tags_client = aws_session_helpers.get_client('cloudtrail', home_region)
+            for i in range(0, len(trail_ARNs), LIST_TAGS_BATCH_SIZE):
+                try:
+                    tagging = tags_client.list_tags(
+                        ResourceIdList=trail_ARNs[i:i + LIST_TAGS_BATCH_SIZE]
+                    )
+                except ClientError as e:
+                    errors.append(f"Error getting tags for trails in {home_region}: {e}")
+                    continue
+                for resource in tagging['ResourceTagList']:
+                    if any(tag['Key'] == AWSnare_tag for tag in resource.get('TagsList', [])):
+                        tagged_arns.add(resource['ResourceId'])
+
+        return [trail['Name'] for trail in trails if trail['TrailARN'] in tagged_arns], errors
+
+    results = aws_session_helpers.map_regions(region_trails, all_regions)
+    for region_name, (trail_names, errors) in zip(all_regions, results):
         print(f"Trails in region {region_name}:")
+        for error in errors:
+            print(error)
+        for trail_name in trail_names:
+            print (trail_name)
 
-        # List all buckets
-        response = client.list_trails()
-
-        for trail in response['Trails']:
-            trail_name = trail['Name']
-            trail_ARN = trail['TrailARN']
-            trail_region = trail['HomeRegion']
-            try:
-                tagging = client.list_tags(ResourceIdList=[trail_ARN])
-                tag_set = tagging['ResourceTagList'][0]['TagsList']
-                if any(tag['Key'] == AWSnare_tag for tag in tag_set):
-                    print (trail_name)
-            except ClientError as e:
-                # Ignore buckets with no tags or access denied
-                if e.response['Error']['Code'] != 'NoSuchTagSet':
-                    print(f"Error getting tags for {trail_name}: {e}")
-
-def detect_cloudtrail_events_locally():
-    """Detect any activity regarding the snares that are set up"""
+def prompt_cloudtrail_log_window():
+    """Ask for the trail and detection start date. Returns (bucket name, start date, end date)."""
 
-    download = input(f"[?] Download fresh logs to analyze? yes/no (default: yes): ").strip()
-    if download not in ("n", "no", "N", "NO"):
-        trail_region = input(f"Region where trail is located (default: {default_region}) ").strip() or default_region
-        client = boto3.client('cloudtrail', region_name=trail_region)
+    default_region = config_helpers.default_region_get()
+    cloudtrail_trail_name = config_helpers.cloudtrail_name_get()
+
+    trail_region = (input(f"Region where trail is located (default: {default_region}) ").strip()
+                    or default_region)
+    client = boto3.client('cloudtrail', region_name=trail_region)
+
+    trail_name = input(
+        f"Enter the name of the configured trail: (default: {cloudtrail_trail_name}) "
+    ).strip() or cloudtrail_trail_name
+    response = client.get_trail(Name=trail_name)
+    S3_bucket_name = response['Trail']['S3BucketName']
+
+    start_date_tmp = date.today() - timedelta(days=1)
+    user_input = input(f"Detection start date (YYYY-MM-DD, default: {start_date_tmp}): ").strip()
+    if user_input:
+            start_date = datetime.strptime(user_input, "%Y-%m-%d").date()
+    else:
+        start_date = start_date_tmp
+    end_date = date.today()
+
+    return S3_bucket_name, start_date, end_date
+
+def cloudtrail_accounts(s3, bucket_name):
+    """Accounts to scan and the organization id (None for single-account trails).
+
+    For organization trails without an explicit AWS_account_ids list, every
+    account that delivered logs to the bucket is scanned.
+    """
+    org_id = config_helpers.organization_id_get()
+    if org_id and not config_helpers.load_settings().get("AWS_account_ids"):
+        account_ids = aws_s3_helpers.discover_cloudtrail_accounts(s3, bucket_name, org_id)
+        print(f"[+] Found logs of {len(account_ids)} accounts in organization {org_id}")
+        return account_ids, org_id
+    return config_helpers.account_ids_get(), org_id
 
-        trail_name = input(f"Enter the name of the configured trail: (default: {cloudtrail_trail_name}) ").strip() or cloudtrail_trail_name
-        response = client.get_trail(Name=trail_name)
-        S3_bucket_name = response['Trail']['S3BucketName']
+def detect_cloudtrail_events_locally(workers: int = 1, full_rescan: bool = False, compression=None,
+                                     ingest: bool = False, aggregation=None, cache_bytes=None):
+    """Detect any activity regarding the snares that are set up
 
-        start_date_tmp = date.today() - timedelta(days=1)
-        user_input = input(f"Detection start date (YYYY-MM-DD, default: {start_date_tmp}): ").strip()
-        if user_input:
-                start_date = datetime.strptime(user_input, "%Y-%m-%d").date()
-        else:
-            start_date = start_date_tmp
-        end_date = date.today()
+    Unless full_rescan is set, files already scanned with the current rules
+    and snares are neither downloaded nor scanned again. With ingest, the
+    downloaded records are also loaded into the local event store so they
+    can be queried later without downloading them again. Downloaded objects
+    are kept in a local cache of up to cache_bytes (CACHE_MAX_BYTES by
+    default, 0 disables it), so runs over overlapping windows read them
+    from disk instead of S3.
+    """
+
+    all_regions = config_helpers.regions_get()
+
+    download = input(f"[?] Download fresh logs to analyze? yes/no (default: yes): ").strip()
+    if download not in ("n", "no", "N", "NO"):
+        S3_bucket_name, start_date, end_date = prompt_cloudtrail_log_window()
 
         print(f"[+] Downloading Cloudtrail logs from bucket {S3_bucket_name} for configured regions {all_regions}")
 
-        aws_s3_helpers.download_cloudtrail_logs(S3_bucket_name, account_id, all_regions, start_date, end_date)
+        skip_objects = None if full_rescan else detection_logic.scanned_objects()
+        account_ids, org_id = cloudtrail_accounts(
+            aws_s3_helpers.cloudtrail_s3_client(), S3_bucket_name
+        )
+        if cache_bytes is None:
+            cache_bytes = object_cache_helpers.CACHE_MAX_BYTES
+        cache = object_cache_helpers.ObjectCache(max_bytes=cache_bytes) if cache_bytes else None
+        try:
+            aws_s3_helpers.download_cloudtrail_logs(
+                S3_bucket_name, account_ids, all_regions, start_date, end_date,
+                skip_objects=skip_objects, org_id=org_id, cache=cache,
+            )
+        finally:
+            if cache is not None:
+                cache.close()
 
-    detection_logic.detect_cloudtrail()
+    detection_logic.detect_cloudtrail(workers, incremental=not full_rescan, compression=compression,
+                                      aggregation=aggregation)
+
+    if ingest:
+        from core import event_store_helpers
+        event_store_helpers.ingest_directory()
 
     cleanup = input("\n[?] Delete downloaded logs? yes/no (default: no): ").strip().lower()
     if cleanup in ("y", "yes", "Y", "YES"):
         aws_s3_helpers.cleanup_cloudtrail_logs()
 
+def detect_cloudtrail_events_streaming(workers=None, full_rescan: bool = False, compression=None,
+                                       aggregation=None, cache_bytes=None):
+    """Detect snare activity by streaming logs from S3 straight into the matcher.
+
+    Nothing is written to disk except the hits (and the scan checkpoint).
+    Only with cache_bytes is the local object cache of run-local opened,
+    with that budget, and objects already in it read from it instead of S3.
+    """
+
+    all_regions = config_helpers.regions_get()
+
+    workers = workers or detection_logic.STREAM_WORKERS
+
+    S3_bucket_name, start_date, end_date = prompt_cloudtrail_log_window()
+
+    s3 = aws_s3_helpers.cloudtrail_s3_client(workers)
+    account_ids, org_id = cloudtrail_accounts(s3, S3_bucket_name)
+
+    print(f"[+] Streaming Cloudtrail logs from bucket {S3_bucket_name} for {len(account_ids)} "
+          f"account(s) and configured regions {all_regions}")
+
+    objects = aws_s3_helpers.list_cloudtrail_log_objects(
+        s3, S3_bucket_name, account_ids, all_regions, start_date, end_date, org_id
+    )
+
+    etags = {obj["Key"]: obj.get("ETag") for _, _, obj in objects}
+    cache = object_cache_helpers.ObjectCache(max_bytes=cache_bytes) if cache_bytes else None
+    try:
+        detection_logic.detect_cloudtrail_objects(
+            [obj for _, _, obj in objects],
+            lambda key: aws_s3_helpers.open_cloudtrail_log(
+                s3, S3_bucket_name, key, cache, etags[key]
+            ),
+            workers,
+            incremental=not full_rescan,
+            compression=compression,
+            aggregation=aggregation,
+        )
+    finally:
+        if cache is not None:
+            if cache.hits:
+                print(f"[+] {cache.hits} log files read from the local cache")
+            cache.close()
+
+def watch_cloudtrail_events(interval: int = 300, workers=None, iterations=None, compression=None,
+                            aggregation=None, metrics_file=None):
+    """Continuously detect snare activity in new CloudTrail logs, without prompts.
+
+    Uses the configured trail and region. Every interval seconds only keys
+    newer than the StartAfter cursor of each account and region are listed
+    (accounts of an organization trail are re-discovered every poll), and the new logs
+    are streamed into detection. Cursors lag a delivery window behind, so
+    late files are picked up; files listed again are skipped through the
+    scan checkpoint. Cursors are saved after each poll, so a
+    restarted watch continues where it stopped. iterations limits the number
+    of polls (runs forever by default). Hits go to one rotating NDJSON
+    output for the whole session, which is closed cleanly on Ctrl+C or
+    SIGTERM. With aggregation (HitAggregator options), repeated hits are
+    folded into summaries across polls. With metrics_file, the pipeline
+    stats of the session are written in Prometheus format after every poll.
+    """
+
+    default_region = config_helpers.default_region_get()
+    all_regions = config_helpers.regions_get()
+    cloudtrail_trail_name = config_helpers.cloudtrail_name_get()
+
+    workers = workers or detection_logic.STREAM_WORKERS
+
+    client = boto3.client('cloudtrail', region_name=default_region)
+    S3_bucket_name = client.get_trail(Name=cloudtrail_trail_name)['Trail']['S3BucketName']
+    s3 = aws_s3_helpers.cloudtrail_s3_client(workers)
+
+    cursors = checkpoint_helpers.load_watch_cursors(S3_bucket_name)
+
+    def watched_prefixes():
+        account_ids, org_id = cloudtrail_accounts(s3, S3_bucket_name)
+        start = (datetime.now(timezone.utc)
+                 - timedelta(seconds=aws_s3_helpers.CLOUDTRAIL_DELIVERY_WINDOW))
+        prefixes = []
+        for account_id in account_ids:
+            for region in all_regions:
+                prefix = aws_s3_helpers.cloudtrail_region_prefix(account_id, region, org_id)
+                # Prefixes never polled start a delivery window back, also across midnight
+                cursors.setdefault(prefix, aws_s3_helpers.cloudtrail_key_cursor(prefix, start))
+                prefixes.append(prefix)
+        return prefixes
+
+    print(f"[+] Watching Cloudtrail logs in bucket {S3_bucket_name} for configured regions "
+          f"{all_regions} every {interval}s (Ctrl+C to stop)")
+
+    # Turn SIGTERM into an exception so the hits output is closed properly
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    writer = hits_helpers.HitWriter(detection_logic.DETECTIONS_DIR, compression)
+    if aggregation is not None:
+        snares = detection_logic.SnareMatcher(snare_registry_helpers.snare_arns())
+        writer = detection_logic.HitAggregator(writer, snares, **aggregation)
+
+    poll = 0
+    try:
+        while iterations is None or poll < iterations:
+            if poll:
+                time.sleep(interval)
+            poll += 1
+
+            objects, new_cursors = aws_s3_helpers.list_new_cloudtrail_log_objects(
+                s3, S3_bucket_name, watched_prefixes(), cursors
+            )
+            # The lagging cursors list recent objects again
+            scanned = detection_logic.scanned_objects()
+            objects = [
+                obj for obj in objects
+                if not checkpoint_helpers.is_scanned(
+                    scanned, obj["Key"], obj.get("ETag"), obj.get("Size")
+                )
+            ]
+            if objects:
+                detection_logic.detect_cloudtrail_objects(
+                    objects,
+                    lambda key: aws_s3_helpers.open_cloudtrail_log(s3, S3_bucket_name, key),
+                    workers,
+                    writer=writer,
+                )
+            cursors = new_cursors
+            checkpoint_helpers.save_watch_cursors(S3_bucket_name, cursors)
+            if metrics_file:
+                stats_helpers.STATS.write_prometheus(metrics_file)
+    except KeyboardInterrupt:
+        print("\n[+] Stopped watching")
+    finally:
+        writer.close()
+
+def lookup_snare_events(snares, regions, start_times, end_time, endpoint_url=None,
+                        rate=LOOKUP_EVENTS_RATE):
+    """Query the CloudTrail LookupEvents API for events on the snares.
+
+    Each snare is looked up by ARN in its own region (in every region if it
+    has none). Regions are queried concurrently, each through its own token
+    bucket because the quota is per account and region.
+    start_times: region -> start of the queried window
+    Returns region -> CloudTrail records (deduplicated by event id), or
+    None for regions where the lookup failed.
+    """
+
+    def lookup_region(region):
+        client = aws_session_helpers.get_client('cloudtrail', region, endpoint_url)
+        # No bursts: requests are spaced evenly so the API's own bucket never runs dry
+        bucket = aws_session_helpers.TokenBucket(rate, capacity=1)
+        records = {}
+        requests = 0
+        try:
+            for snare in snares:
+                if snare["region"] not in (None, region):
+                    continue
+                kwargs = {
+                    "LookupAttributes": [
+                        {"AttributeKey": "ResourceName", "AttributeValue": snare["arn"]}
+                    ],
+                    "StartTime": start_times[region],
+                    "EndTime": end_time,
+                    "MaxResults": 50,
+                }
+                while True:
+                    bucket.acquire()
+                    response = client.lookup_events(**kwargs)
+                    requests += 1
+                    for event in response.get("Events", []):
+                        if event.get("CloudTrailEvent"):
+                            records.setdefault(event.get("EventId"), event["CloudTrailEvent"])
+                    if not response.get("NextToken"):
+                        break
+                    kwargs["NextToken"] = response["NextToken"]
+        except ClientError as e:
+            print(f"[!] LookupEvents failed in {region}: {e}")
+            return None, requests
+        return [json.loads(record) for record in records.values()], requests
+
+    with stats_helpers.STATS.stage("lookup") as counters:
+        results = dict(zip(regions, aws_session_helpers.map_regions(lookup_region, regions)))
+        counters["records"] = sum(len(records or []) for records, _ in results.values())
+    requests = sum(region_requests for _, region_requests in results.values())
+    print(f"[+] Looked up {len(snares)} snares in {len(regions)} regions with {requests} "
+          f"requests: {counters['records']} events")
+    return {region: records for region, (records, _) in results.items()}
+
+def lookup_cloudtrail_events(interval: int = 60, iterations=None, lookback: int = 3600,
+                             endpoint_url=None, compression=None, aggregation=None,
+                             metrics_file=None):
+    """Detect activity on management-event snares (secrets) through the CloudTrail LookupEvents API.
+
+    Events show up in LookupEvents within minutes, instead of waiting for
+    CloudTrail to deliver log files to S3. Every interval seconds each
+    secret snare is looked up in the configured regions, from the end of
+    the previous poll (minus LOOKUP_OVERLAP) or lookback seconds ago on
+    the first poll, and new events go through the same rules as the log
+    files. Per-region cursors and recently seen event ids are saved after
+    each poll, so events are reported once across restarts. endpoint_url
+    points the CloudTrail clients at another endpoint, such as a local
+    stub. iterations, aggregation and metrics_file work as for watch.
+    """
+
+    all_regions = config_helpers.regions_get()
+    account_id = config_helpers.account_id_get()
+
+    # LookupEvents only sees the events of the current account
+    snares = [
+        snare
+        for resource_type in LOOKUP_RESOURCE_TYPES
+        for snare in snare_registry_helpers.list_snares(resource_type)
+        if snare["account_id"] in (None, account_id)
+    ]
+    if not snares:
+        print(f"[!] No snares of type {', '.join(LOOKUP_RESOURCE_TYPES)} "
+              f"to look up in account {account_id}")
+        return
+
+    cursors = checkpoint_helpers.load_lookup_cursors(account_id)
+
+    print(f"[+] Looking up {len(snares)} snares in configured regions {all_regions} "
+          f"every {interval}s (Ctrl+C to stop)")
+
+    # Turn SIGTERM into an exception so the hits output is closed properly
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    writer = hits_helpers.HitWriter(detection_logic.DETECTIONS_DIR, compression)
+    if aggregation is not None:
+        snares_matcher = detection_logic.SnareMatcher(snare_registry_helpers.snare_arns())
+        writer = detection_logic.HitAggregator(writer, snares_matcher, **aggregation)
+
+    poll = 0
+    try:
+        while iterations is None or poll < iterations:
+            if poll:
+                time.sleep(interval)
+            poll += 1
+
+            now = datetime.now(timezone.utc)
+            overlap, lookback_delta = timedelta(seconds=LOOKUP_OVERLAP), timedelta(seconds=lookback)
+            start_times = {
+                region: datetime.fromisoformat(cursors[region]["end"]) - overlap
+                if region in cursors else now - lookback_delta
+                for region in all_regions
+            }
+            results = lookup_snare_events(snares, all_regions, start_times, now, endpoint_url)
+
+            # Event ids older than the next window can not be returned again
+            horizon = (now - timedelta(seconds=LOOKUP_OVERLAP)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            new_records = []
+            for region, records in results.items():
+                if records is None:
+                    # Failed: the next poll queries this region's window again
+                    continue
+                seen = cursors.get(region, {}).get("seen", {})
+                fresh = [record for record in records if record.get("eventID") not in seen]
+                new_records.extend(fresh)
+                seen.update(
+                    (record["eventID"], record.get("eventTime") or "")
+                    for record in fresh if record.get("eventID")
+                )
+                cursors[region] = {
+                    "end": now.isoformat(),
+                    "seen": {
+                        event_id: event_time
+                        for event_id, event_time in seen.items() if event_time >= horizon
+                    },
+                }
+
+            if new_records:
+                detection_logic.detect_cloudtrail_records(new_records, writer)
+            checkpoint_helpers.save_lookup_cursors(account_id, cursors)
+            if metrics_file:
+                stats_helpers.STATS.write_prometheus(metrics_file)
+    except KeyboardInterrupt:
+        print("\n[+] Stopped looking up")
+    finally:
+        writer.close()
+
 def update_selectors(trail_region = "", trail_name = ""):
-    ARN_list = config_helpers.AWS_snares_arn_list_get()
+    default_region = config_helpers.default_region_get()
+    cloudtrail_trail_name = config_helpers.cloudtrail_name_get()
+
+    ARN_list = snare_registry_helpers.snare_arns("S3")
 
     if not trail_region:
         trail_region = default_region
@@ -103,6 +476,10 @@ def update_selectors(trail_region = "", trail_name = ""):
 def create_cloudtrail_trail():
     """Create cloudtrail trail where snare logs will be stored."""
 
+    default_region = config_helpers.default_region_get()
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+    account_id = config_helpers.account_id_get()
+
     print("This function will create a new CloudTrail trail and respective S3 bucket for logs\n")
 
     trail_region = input(f"Region where trail will be created (default: {default_region}) ").strip() or default_region
@@ -112,9 +489,18 @@ def create_cloudtrail_trail():
     trail_name = (input(f"New trail name (default: {AWSnare_tag}-{random_suffix}) ").strip() or AWSnare_tag+"-"+random_suffix).lower()
     trail_bucket_name = (input(f"New trail bucket name (default: {trail_name}-bucket):" ).strip() or trail_name+"-bucket").lower()
 
+    org_id = None
+    org_trail = input("Create an organization trail logging all accounts of the organization? "
+                      "(y/N) ")
+    if org_trail.strip().lower() == "y":
+        try:
+            org_id = boto3.client('organizations').describe_organization()['Organization']['Id']
+        except ClientError as e:
+            print(f"[!] Error getting the organization, creating a single-account trail: {e}")
+
     aws_s3_helpers.create_s3_bucket(False, trail_bucket_name, trail_region)
 
-    aws_s3_helpers.attach_bucket_policy(trail_bucket_name, account_id)
+    aws_s3_helpers.attach_bucket_policy(trail_bucket_name, account_id, org_id)
 
     try:
         response = client.create_trail(
@@ -123,7 +509,7 @@ def create_cloudtrail_trail():
         #SnsTopicName='string', TODO implement SNS?
         IncludeGlobalServiceEvents=True,
         IsMultiRegionTrail=True,
-        IsOrganizationTrail=False,
+        IsOrganizationTrail=org_id is not None,
         TagsList=[
             {
                 'Key': AWSnare_tag,
@@ -138,6 +524,7 @@ def create_cloudtrail_trail():
     update_selectors(trail_region, trail_name)
 
     config_helpers.cloudtrail_name_set(trail_name)
+    config_helpers.organization_id_set(org_id)
 
     print(f"[+] Starting logging for {trail_name}")
     client.start_logging(Name=trail_name)
@@ -1,45 +1,147 @@
 """Module for AWS S3 interactions."""
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import os
 import json
 import gzip
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+import threading
+import time
 
 from core import config_helpers
 from core import random_helpers
+from core import checkpoint_helpers
+from core import aws_session_helpers
+from core import snare_registry_helpers
+from core import stats_helpers
 
+# Threads (and pooled connections) used to download CloudTrail logs
+DOWNLOAD_WORKERS = 16
 
-default_region = config_helpers.default_region_get()
-all_regions = config_helpers.regions_get()
-AWSnare_tag = config_helpers.AWSnare_tag_get()
+# Concurrent listings when enumerating accounts x regions x days log prefixes
+LIST_WORKERS = 64
 
-def get_s3_bucket_names():
-    """Retrieve a list of S3 bucket names."""
+# Seconds CloudTrail may take to deliver a log file. Watch cursors stay this
+# far behind the present, so late and out-of-order files are still listed
+CLOUDTRAIL_DELIVERY_WINDOW = 900
 
-    print(f"[+] Fetching S3 buckets with tag: '{AWSnare_tag}'...")
-    s3 = boto3.client('s3')
+# Local cache of the tagged snare buckets, reused for S3_INVENTORY_TTL seconds
+S3_INVENTORY_CACHE_FILE = os.path.join(".cache", "s3_snare_buckets.json")
+S3_INVENTORY_TTL = 300
+
+# Names tried per bucket in bulk creation when a name is already taken
+BULK_NAME_ATTEMPTS = 5
+
+def _tagged_buckets_by_tagging_api(bucket_regions, AWSnare_tag):
+    """Tagged bucket names via the Resource Groups Tagging API.
+
+    One paginated query per bucket region.
+    """
+
+    def region_buckets(region_name):
+        client = aws_session_helpers.get_client('resourcegroupstaggingapi', region_name)
+        paginator = client.get_paginator('get_resources')
+        return [
+            resource['ResourceARN'][len("arn:aws:s3:::"):]
+            for page in paginator.paginate(
+                TagFilters=[{'Key': AWSnare_tag}], ResourceTypeFilters=['s3']
+            )
+            for resource in page['ResourceTagMappingList']
+        ]
+
+    regions = sorted(bucket_regions)
+    results = aws_session_helpers.map_regions(region_buckets, regions)
+    return {name for names in results for name in names}
 
-    # List all buckets
-    buckets = s3.list_buckets()
+def _tagged_buckets_by_bucket_tagging(s3, bucket_names, AWSnare_tag):
+    """Tagged bucket names via concurrent per-bucket GetBucketTagging calls."""
 
-    for bucket in buckets['Buckets']:
-        bucket_name = bucket['Name']
+    def is_tagged(bucket_name):
         try:
             tagging = s3.get_bucket_tagging(Bucket=bucket_name)
-            tag_set = tagging['TagSet']
-            if any(tag['Key'] == AWSnare_tag for tag in tag_set):
-                print (f"- {bucket_name}")
+            return any(tag['Key'] == AWSnare_tag for tag in tagging['TagSet'])
         except ClientError as e:
             # Ignore buckets with no tags or access denied
             if e.response['Error']['Code'] != 'NoSuchTagSet':
                 print(f"Error getting tags for {bucket_name}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        results = pool.map(is_tagged, bucket_names)
+        return {name for name, tagged in zip(bucket_names, results) if tagged}
+
+def tagged_s3_bucket_names(refresh=False):
+    """
+    Returns the sorted names of S3 buckets carrying the AWSnare tag.
+    Uses the Resource Groups Tagging API for the regions the buckets live in
+    and falls back to concurrent per-bucket tag lookups if that is not
+    available. Results are cached for S3_INVENTORY_TTL seconds.
+    """
+
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+
+    if not refresh:
+        try:
+            with open(S3_INVENTORY_CACHE_FILE, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            age = time.time() - cache.get("fetched_at", 0)
+            if cache.get("tag") == AWSnare_tag and age < S3_INVENTORY_TTL:
+                return cache["buckets"]
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    s3 = aws_session_helpers.get_client('s3')
+    buckets = [
+        bucket
+        for page in s3.get_paginator('list_buckets').paginate()
+        for bucket in page['Buckets']
+    ]
+    bucket_names = [bucket['Name'] for bucket in buckets]
+
+    tagged = None
+    bucket_regions = {bucket.get('BucketRegion') for bucket in buckets}
+    if buckets and None not in bucket_regions:
+        try:
+            tagged = _tagged_buckets_by_tagging_api(bucket_regions, AWSnare_tag) & set(bucket_names)
+        except ClientError as e:
+            print(f"[!] Tagging API unavailable, checking bucket tags one by one: {e}")
+    if tagged is None:
+        tagged = _tagged_buckets_by_bucket_tagging(s3, bucket_names, AWSnare_tag)
+
+    tagged_names = sorted(tagged)
+    checkpoint_helpers.write_json_atomic(S3_INVENTORY_CACHE_FILE, {
+        "tag": AWSnare_tag,
+        "fetched_at": time.time(),
+        "buckets": tagged_names,
+    })
+    return tagged_names
+
+def invalidate_s3_inventory_cache():
+    try:
+        os.remove(S3_INVENTORY_CACHE_FILE)
+    except FileNotFoundError:
+        pass
+
+def get_s3_bucket_names(refresh=False):
+    """Retrieve a list of S3 bucket names."""
+
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+
+    print(f"[+] Fetching S3 buckets with tag: '{AWSnare_tag}'...")
+
+    for bucket_name in tagged_s3_bucket_names(refresh):
+        print (f"- {bucket_name}")
 
 def create_s3_bucket(snare: bool, bucket_name = "", chosen_region = ""):
     """Create a new S3 bucket."""
 
+    default_region = config_helpers.default_region_get()
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+
     tmp_name = random_helpers.generate_aws_resource_name()
 
     if not bucket_name:
@@ -75,11 +177,13 @@ def create_s3_bucket(snare: bool, bucket_name = "", chosen_region = ""):
     except ClientError as e:
         print(f"[!] Error applying tags to S3 bucket: {e}")
 
+    invalidate_s3_inventory_cache()
+
     # If snare bucket - add ARN to config.yaml
     if snare:
         arn = f"arn:aws:s3:::{bucket_name}"
         print(f"[+] Added arn '{arn}' to the snares list")
-        config_helpers.AWS_snares_arn_list_add(arn)
+        snare_registry_helpers.add_snare(arn, chosen_region)
 
         uplod_mock_data = input(f"[?] Do you want to upload mock data file to the S3 bucket? yes/no (default: yes): ").strip()
         while uplod_mock_data not in ("n", "no", "N", "NO"):
@@ -87,6 +191,72 @@ def create_s3_bucket(snare: bool, bucket_name = "", chosen_region = ""):
             uplod_mock_data = input(f"[?] Do you want to upload another mock data file> yes/no (default: yes): ").strip()
 
 
+def create_s3_buckets_bulk(count, regions):
+    """
+    Create `count` snare buckets spread round-robin over `regions`, without prompts.
+    Buckets are created and tagged concurrently and all ARNs are added to the
+    snare registry in one transaction (`snare_registry_helpers.add_snares`).
+    If any bucket fails, the ones already created in this batch are deleted
+    and nothing is registered.
+    """
+
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+
+    taken = snare_registry_helpers.snare_names("S3")
+    names = random_helpers.generate_unique_aws_resource_names(count, taken)
+    taken.update(names)
+    names_lock = threading.Lock()
+
+    def create(item):
+        bucket_name, region = item
+        s3 = aws_session_helpers.get_client('s3', region)
+        for _ in range(BULK_NAME_ATTEMPTS):
+            try:
+                if region == "us-east-1":
+                    s3.create_bucket(Bucket=bucket_name)
+                else:
+                    s3.create_bucket(
+                        Bucket=bucket_name,
+                        CreateBucketConfiguration={'LocationConstraint': region},
+                    )
+                break
+            except ClientError as e:
+                # Bucket names are global, pick another one if someone else has it
+                code = e.response['Error']['Code']
+                if code not in ('BucketAlreadyExists', 'BucketAlreadyOwnedByYou'):
+                    raise
+                with names_lock:
+                    bucket_name = random_helpers.generate_unique_aws_resource_names(1, taken)[0]
+                    taken.add(bucket_name)
+        else:
+            raise RuntimeError(f"[!] No free bucket name found after {BULK_NAME_ATTEMPTS} attempts")
+
+        try:
+            s3.put_bucket_tagging(
+                Bucket=bucket_name, Tagging={'TagSet': [{'Key': AWSnare_tag, 'Value': 'true'}]}
+            )
+        except ClientError:
+            s3.delete_bucket(Bucket=bucket_name)
+            raise
+        return bucket_name, region
+
+    def delete(created):
+        bucket_name, region = created
+        aws_session_helpers.get_client('s3', region).delete_bucket(Bucket=bucket_name)
+
+    items = [(name, regions[i % len(regions)]) for i, name in enumerate(names)]
+    created = aws_session_helpers.create_all_or_nothing(create, delete, items)
+    invalidate_s3_inventory_cache()
+    for bucket_name, region in created:
+        print(f"[+] S3 bucket '{bucket_name}' created in {region}")
+
+    arns = [f"arn:aws:s3:::{bucket_name}" for bucket_name, _ in created]
+    snare_registry_helpers.add_snares(
+        [{"arn": arn, "region": region} for arn, (_, region) in zip(arns, created)]
+    )
+    print(f"[+] Added {len(arns)} S3 bucket arns to the snares list")
+    return arns
+
 def upload_snare_data(bucket_name):
     base_dir = Path(__file__).parent
     mock_s3_files_dir = base_dir / ".." / "snare_data" / "S3"
@@ -115,39 +285,265 @@ def upload_snare_data(bucket_name):
     except ClientError as e:
         raise RuntimeError("[!] Error uploading file: {e}")
 
-def download_cloudtrail_logs(bucket_name, account_id, regions, start_date, end_date):
+    snare_registry_helpers.add_seeded_object(f"arn:aws:s3:::{bucket_name}", chosen_file)
+
+def delete_s3_bucket(bucket_name = ""):
+    """Delete a snare bucket (and its objects) and remove it from the snare registry."""
+
+    if not bucket_name:
+        bucket_name = input("Enter the name of the S3 snare bucket to delete: ").strip()
+
+    snare = snare_registry_helpers.find_snare(bucket_name, "S3")
+    if snare is None:
+        print(f"[!] '{bucket_name}' is not a registered S3 snare")
+        return
+
+    s3 = aws_session_helpers.get_client('s3')
+    try:
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                s3.delete_objects(Bucket=bucket_name, Delete={'Objects': objects})
+        s3.delete_bucket(Bucket=bucket_name)
+        print(f"[+] S3 bucket '{bucket_name}' deleted.")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchBucket':
+            raise RuntimeError(f"[!] Error deleting S3 bucket: {e}") from e
+
+    snare_registry_helpers.remove_snare(snare["arn"])
+    invalidate_s3_inventory_cache()
+    print(f"[+] Removed arn '{snare['arn']}' from the snares list")
+
+def cloudtrail_s3_client(max_workers=DOWNLOAD_WORKERS):
+    """S3 client with a connection pool large enough to be shared by max_workers threads.
+
+    The pool also covers the listing threads.
+    """
+    return boto3.client('s3', config=Config(
+        max_pool_connections=max(max_workers, LIST_WORKERS),
+        retries={'max_attempts': 10, 'mode': 'adaptive'},
+    ))
+
+def cloudtrail_key_account(key):
+    """Account id a CloudTrail log key belongs to (AWSLogs/[<org-id>/]<account>/CloudTrail/...)."""
+    parts = key.split("/")
+    return parts[parts.index("CloudTrail") - 1] if "CloudTrail" in parts else None
+
+def cloudtrail_account_prefix(account_id, org_id=None):
+    """Key prefix of one account's logs; organization trails nest accounts under the org id."""
+    if org_id:
+        return f"AWSLogs/{org_id}/{account_id}/"
+    return f"AWSLogs/{account_id}/"
+
+def cloudtrail_region_prefix(account_id, region, org_id=None):
+    return f"{cloudtrail_account_prefix(account_id, org_id)}CloudTrail/{region}/"
+
+def cloudtrail_key_cursor(prefix, when):
+    """StartAfter key under a region prefix sorting just before the logs stamped at when (UTC)."""
+    account_id, _, region = prefix.rstrip("/").split("/")[-3:]
+    return f"{prefix}{when:%Y/%m/%d}/{account_id}_CloudTrail_{region}_{when:%Y%m%dT%H%M}Z"
+
+def _list_subprefixes(s3, bucket_name, prefix):
+    """Names of the "directories" directly under a prefix."""
+    paginator = s3.get_paginator("list_objects_v2")
+    return [
+        common["Prefix"][len(prefix):].rstrip("/")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter="/")
+        for common in page.get("CommonPrefixes", [])
+    ]
+
+def discover_cloudtrail_accounts(s3, bucket_name, org_id):
+    """Account ids with logs in an organization trail bucket (AWSLogs/<org-id>/<account>/)."""
+    accounts = _list_subprefixes(s3, bucket_name, f"AWSLogs/{org_id}/")
+    return sorted(account for account in accounts if account.isdigit())
+
+def cloudtrail_log_locations(s3, bucket_name, account_ids, regions, org_id=None):
+    """
+    Returns the (account, region) pairs among account_ids x regions that have logs.
+    One delimiter listing per account, run concurrently, so day prefixes of
+    accounts and regions without logs are never listed.
+    """
+
+    def account_regions(account_id):
+        prefix = f"{cloudtrail_account_prefix(account_id, org_id)}CloudTrail/"
+        present = set(_list_subprefixes(s3, bucket_name, prefix))
+        return [(account_id, region) for region in regions if region in present]
+
+    with ThreadPoolExecutor(max_workers=LIST_WORKERS) as pool:
+        results = pool.map(account_regions, account_ids)
+        return [location for locations in results for location in locations]
+
+def cloudtrail_log_prefixes(locations, start_date, end_date, org_id=None):
+    """Return (region, date, prefix) for every day x (account, region) location in the window."""
+    prefixes = []
+    current_date = start_date
+    while current_date <= end_date:
+        for account_id, region in locations:
+            prefix = (f"{cloudtrail_region_prefix(account_id, region, org_id)}"
+                      f"{current_date.year}/{current_date.month:02}/{current_date.day:02}/")
+            prefixes.append((region, current_date, prefix))
+        current_date += timedelta(days=1)
+    return prefixes
+
+def list_cloudtrail_log_objects(s3, bucket_name, account_ids, regions, start_date, end_date,
+                                org_id=None):
+    """
+    Lists CloudTrail log objects for all days, accounts and regions concurrently.
+    account_ids: account ids whose logs are listed (org trails: see discover_cloudtrail_accounts)
+    org_id: organization id for organization trail buckets
+    Returns (region, date, object) tuples in day, account, region, key order.
     """
-    Downloads CloudTrail logs for multiple dates and regions.
+
+    def list_prefix(prefix_info):
+        region, current_date, prefix = prefix_info
+        paginator = s3.get_paginator("list_objects_v2")
+        return [
+            (region, current_date, obj)
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
+
+    with stats_helpers.STATS.stage("list") as counters:
+        locations = cloudtrail_log_locations(s3, bucket_name, account_ids, regions, org_id)
+        prefixes = cloudtrail_log_prefixes(locations, start_date, end_date, org_id)
+        with ThreadPoolExecutor(max_workers=LIST_WORKERS) as pool:
+            objects = [obj for objects in pool.map(list_prefix, prefixes) for obj in objects]
+        counters["records"] = len(objects)
+        counters["bytes"] = sum(obj.get("Size", 0) for _, _, obj in objects)
+    return objects
+
+def download_cloudtrail_logs(bucket_name, account_ids, regions, start_date, end_date,
+                             max_workers=DOWNLOAD_WORKERS, count_records=False, skip_objects=None,
+                             org_id=None, cache=None):
+    """
+    Downloads CloudTrail logs for multiple dates, accounts and regions.
     start_date / end_date: datetime.date objects
+    account_ids: list of account ids; org_id: organization id for organization trail buckets
     regions: list of AWS region strings
+    Prefixes are listed and objects downloaded on a bounded thread pool
+    sharing one S3 client. Set count_records to print the number of events
+    in each file (this decompresses every file once more).
+    skip_objects: scan checkpoint entries; objects already scanned are not downloaded
+    cache: ObjectCache; objects with the same key and ETag already in it are not downloaded again
     """
 
-    s3 = boto3.client('s3')
+    s3 = cloudtrail_s3_client(max_workers)
 
     download_dir = 'logs_cloudtrail'
+    os.makedirs(download_dir, exist_ok=True)
 
-    current_date = start_date
-    while current_date <= end_date:
-        for region in regions:
-            prefix = f"AWSLogs/{account_id}/CloudTrail/{region}/{current_date.year}/{current_date.month:02}/{current_date.day:02}/"
+    objects = list_cloudtrail_log_objects(
+        s3, bucket_name, account_ids, regions, start_date, end_date, org_id
+    )
+    if skip_objects:
+        listed = len(objects)
+        objects = [
+            (region, current_date, obj) for region, current_date, obj in objects
+            if not checkpoint_helpers.is_scanned(
+                skip_objects, obj["Key"], obj.get("ETag"), obj.get("Size")
+            )
+        ]
+        print(f"[+] Skipping {listed - len(objects)} log files already scanned")
+
+    def download(object_info):
+        region, current_date, obj = object_info
+        key = obj["Key"]
+        filename = key.split("/")[-1]
+        if org_id or len(account_ids) > 1:
+            # Several accounts may deliver files with the same name
+            filename = f"{cloudtrail_key_account(key)}_{filename}"
+        local_path = os.path.join(download_dir, f"{region}_{current_date}_{filename}")
+
+        if cache is not None and obj.get("ETag"):
+            cached = cache.fetch(
+                key, obj["ETag"], lambda path: s3.download_file(bucket_name, key, path), local_path
+            )
+        else:
+            s3.download_file(bucket_name, key, local_path)
+            cached = False
+        action = 'Copied from cache' if cached else 'Downloaded'
+        message = f"[{current_date} - {region}] {action} {key}"
+        index_entry = {"s3_key": key, "etag": obj.get("ETag"), "size": obj.get("Size")}
+
+        if count_records:
+            with gzip.open(local_path, "rt") as f:
+                log_data = json.load(f)
+                message += f"\n  → {len(log_data['Records'])} events"
+        print(message)
+        return os.path.basename(local_path), index_entry
+
+    with stats_helpers.STATS.stage("download") as counters, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # dict() re-raises the first download error, if any
+        downloaded = dict(pool.map(download, objects))
+        counters["records"] = len(objects)
+        counters["bytes"] = sum(obj.get("Size", 0) for _, _, obj in objects)
+
+    checkpoint_helpers.update_objects_index(download_dir, downloaded)
+
+    print(f"Finished downloading {len(objects)} log files")
+    if cache is not None:
+        print(f"[+] {cache.hits} of them served from the local cache "
+              f"({cache.total_bytes / 1024 ** 2:.1f} of {cache.max_bytes / 1024 ** 2:.0f} MB used)")
+
+def list_new_cloudtrail_log_objects(s3, bucket_name, prefixes, cursors, max_workers=LIST_WORKERS,
+                                    delivery_window=CLOUDTRAIL_DELIVERY_WINDOW):
+    """
+    Lists CloudTrail log objects added after the per-prefix cursors.
+    prefixes: account / region prefixes (see cloudtrail_region_prefix)
+    cursors: prefix -> StartAfter key under that prefix. Keys under a
+    region prefix sort by the time CloudTrail stamped them, so listing
+    with StartAfter=cursor only returns newer logs.
+    The updated cursors trail the present by delivery_window seconds
+    rather than jumping to the last key listed, so a file delivered late
+    is still listed by a later poll. Objects near the end of a listing
+    are therefore listed again; the caller skips those already scanned.
+    Returns (objects, updated cursors); the caller saves the cursors once
+    the objects are processed.
+    """
 
-            paginator = s3.get_paginator("list_objects_v2")
-            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
-                for obj in page.get("Contents", []):
-                    key = obj["Key"]
-                    filename = key.split("/")[-1]
-                    local_path = os.path.join(download_dir, f"{region}_{current_date}_{filename}")
+    lagged = datetime.now(timezone.utc) - timedelta(seconds=delivery_window)
 
-                    print(f"[{current_date} - {region}] Downloading {key}...")
-                    s3.download_file(bucket_name, key, local_path)
+    def list_prefix(prefix):
+        paginator = s3.get_paginator("list_objects_v2")
+        return [
+            obj
+            for page in paginator.paginate(
+                Bucket=bucket_name, Prefix=prefix, StartAfter=cursors[prefix]
+            )
+            for obj in page.get("Contents", [])
+        ]
 
-                    # Optional: Parse logs immediately
-                    with gzip.open(local_path, "rt") as f:
-                        log_data = json.load(f)
-                        print(f"  → {len(log_data['Records'])} events")
+    new_cursors = dict(cursors)
+    objects = []
+    with stats_helpers.STATS.stage("list") as counters, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for prefix, prefix_objects in zip(prefixes, pool.map(list_prefix, prefixes)):
+            objects.extend(prefix_objects)
+            new_cursors[prefix] = max(cursors[prefix], cloudtrail_key_cursor(prefix, lagged))
+        counters["records"] = len(objects)
+        counters["bytes"] = sum(obj.get("Size", 0) for obj in objects)
+    return objects, new_cursors
+
+def open_cloudtrail_log(s3, bucket_name, key, cache=None, etag=None):
+    """Open a CloudTrail log object as a decompressed binary stream, without writing it to disk.
+
+    With cache and etag, a copy already in the local object cache is read
+    instead of fetching the object.
+    """
+    from core import detection_logic
 
-        current_date += timedelta(days=1)
-    print("Finished downloading logs")
+    if cache is not None and etag:
+        path = cache.get(key, etag)
+        if path is not None:
+            try:
+                return detection_logic.get_decoder().open_file(path)
+            except FileNotFoundError:
+                # Evicted in the meantime
+                pass
+    body = s3.get_object(Bucket=bucket_name, Key=key)['Body']
+    return detection_logic.get_decoder().open_fileobj(body)
 
 def cleanup_cloudtrail_logs():
     download_dir = 'logs_cloudtrail'
@@ -160,11 +556,19 @@ def cleanup_cloudtrail_logs():
                 print(f"[!] Failed to delete {file_path}: {e}")
 
 
-def attach_bucket_policy(bucket_name, account_id):
-    """Attach the required bucket policy for CloudTrail."""
+def attach_bucket_policy(bucket_name, account_id, org_id=None):
+    """Attach the required bucket policy for CloudTrail.
+
+    With org_id, the organization trail may also write the logs of the
+    member accounts (AWSLogs/<org-id>/).
+    """
 
     s3 = boto3.client('s3')
 
+    log_resources = [f"arn:aws:s3:::{bucket_name}/AWSLogs/{account_id}/*"]
+    if org_id:
+        log_resources.append(f"arn:aws:s3:::{bucket_name}/AWSLogs/{org_id}/*")
+
     policy = {
         "Version": "2012-10-17",
         "Statement": [
@@ -180,7 +584,7 @@ def attach_bucket_policy(bucket_name, account_id):
                 "Effect": "Allow",
                 "Principal": {"Service": "cloudtrail.amazonaws.com"},
                 "Action": "s3:PutObject",
-                "Resource": f"arn:aws:s3:::{bucket_name}/AWSLogs/{account_id}/*",
+                "Resource": log_resources,
                 "Condition": {
                     "StringEquals": {"s3:x-amz-acl": "bucket-owner-full-control"}
                 }
@@ -8,32 +8,39 @@ import uuid
 
 from core import config_helpers
 from core import random_helpers
-
-default_region = config_helpers.default_region_get()
-all_regions = config_helpers.regions_get()
-AWSnare_tag = config_helpers.AWSnare_tag_get()
+from core import aws_session_helpers
+from core import snare_registry_helpers
 
 def get_secrets_names():
     """Retrieve a list of secrets from Secrets manager."""
 
-    print(f"[+] Fetching secrets with tag: '{AWSnare_tag}'...")
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+    all_regions = config_helpers.regions_get()
 
-    for region_name in all_regions:
-        session = boto3.Session()
-        client = session.client(
-            service_name='secretsmanager',
-            region_name=region_name,
-        )
+    print(f"[+] Fetching secrets with tag: '{AWSnare_tag}'...")
 
-        response = client.list_secrets(Filters=[{'Key': 'tag-key', 'Values': [AWSnare_tag]}])
+    def region_secrets(region_name):
+        client = aws_session_helpers.get_client('secretsmanager', region_name)
+        paginator = client.get_paginator('list_secrets')
+        return [
+            secret
+            for page in paginator.paginate(Filters=[{'Key': 'tag-key', 'Values': [AWSnare_tag]}])
+            for secret in page['SecretList']
+        ]
 
+    results = aws_session_helpers.map_regions(region_secrets, all_regions)
+    for region_name, secrets in zip(all_regions, results):
         print(f"Secrets in region {region_name}:")
-        for secret in response['SecretList']:
-            print(f" - Secret Name: {secret['Name']}, Description: {secret['Description']}, ARN: {secret['ARN']}")
+        for secret in secrets:
+            print(f" - Secret Name: {secret['Name']}, Description: {secret.get('Description')}, "
+                  f"ARN: {secret['ARN']}")
 
 def create_secret(snare: bool, secret_name = "", chosen_region = ""):
     """Create a new secret in SecretsManager"""
 
+    default_region = config_helpers.default_region_get()
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+
     tmp_name = random_helpers.generate_aws_resource_name()
 
     if not secret_name:
@@ -63,4 +70,68 @@ def create_secret(snare: bool, secret_name = "", chosen_region = ""):
     if snare:
         arn = response['ARN']
         print(f"[+] Added arn '{arn}' to the snares list")
-        config_helpers.AWS_snares_arn_list_add(arn)
\ No newline at end of file
+        snare_registry_helpers.add_snare(arn, chosen_region)
+
+def delete_secret(secret_name = ""):
+    """Delete a snare secret and remove it from the snare registry."""
+
+    if not secret_name:
+        secret_name = input("Enter the name of the snare secret to delete: ").strip()
+
+    snare = snare_registry_helpers.find_snare(secret_name, "secret")
+    if snare is None:
+        print(f"[!] '{secret_name}' is not a registered secret snare")
+        return
+
+    client = aws_session_helpers.get_client('secretsmanager', snare["region"])
+    try:
+        client.delete_secret(SecretId=snare["arn"], ForceDeleteWithoutRecovery=True)
+        print(f"[+] Secret '{secret_name}' deleted.")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise RuntimeError(f"[!] Error deleting secret: {e}") from e
+
+    snare_registry_helpers.remove_snare(snare["arn"])
+    print(f"[+] Removed arn '{snare['arn']}' from the snares list")
+
+def create_secrets_bulk(count, regions):
+    """Create `count` snare secrets spread round-robin over `regions`, without prompts.
+
+    Secrets are created concurrently and all ARNs are added to the snare
+    registry in one transaction (`snare_registry_helpers.add_snares`). If any
+    secret fails, the ones already created in this batch are deleted and
+    nothing is registered.
+    """
+
+    AWSnare_tag = config_helpers.AWSnare_tag_get()
+
+    taken = snare_registry_helpers.snare_names("secret")
+    names = random_helpers.generate_unique_aws_resource_names(count, taken)
+
+    def create(item):
+        secret_name, region = item
+        client = aws_session_helpers.get_client('secretsmanager', region)
+        response = client.create_secret(
+            Name=secret_name,
+            Description=secret_name,
+            SecretString=str(uuid.uuid4()),
+            Tags=[{'Key': AWSnare_tag, 'Value': 'true'}],
+        )
+        return response['ARN'], region
+
+    def delete(created):
+        arn, region = created
+        aws_session_helpers.get_client('secretsmanager', region).delete_secret(
+            SecretId=arn, ForceDeleteWithoutRecovery=True
+        )
+
+    items = [(name, regions[i % len(regions)]) for i, name in enumerate(names)]
+    created = aws_session_helpers.create_all_or_nothing(create, delete, items)
+
+    for arn, region in created:
+        print(f"[+] Secret '{arn}' created in {region}")
+
+    arns = [arn for arn, _ in created]
+    snare_registry_helpers.add_snares([{"arn": arn, "region": region} for arn, region in created])
+    print(f"[+] Added {len(arns)} secret arns to the snares list")
+    return arns
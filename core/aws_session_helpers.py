@@ -0,0 +1,116 @@
+"""Shared boto3 clients and concurrent fan-out over AWS regions."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from core import config_helpers
+
+# Threads used when querying several regions at once
+REGION_WORKERS = 16
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, region_name=None, endpoint_url=None):
+    """Return a client shared by all threads for this service and region.
+
+    boto3 clients are thread safe, but creating them is slow and not, so they
+    are created once under a lock and reused. endpoint_url points the client
+    at another endpoint, such as a local stub.
+    """
+    key = (service_name, region_name, endpoint_url)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = boto3.client(
+                service_name, region_name=region_name, endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=REGION_WORKERS,
+                    retries={'max_attempts': 10, 'mode': 'adaptive'},
+                ),
+            )
+        return _clients[key]
+
+
+class TokenBucket:
+    """Rate limiter for an API quota: rate calls per second on average, bursts of up to capacity.
+
+    acquire() blocks until a token is free, so threads sharing a bucket
+    stay under the quota instead of being throttled and retried.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def map_regions(func, regions, max_workers=REGION_WORKERS):
+    """Call func(region) for every region concurrently; results are returned in region order."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(func, regions))
+
+
+def resolve_regions(regions):
+    """Turn a --regions value ("all" or comma separated) into a list of regions.
+
+    "all" means every region configured in config.yaml.
+    """
+    if not regions or regions == "all":
+        return config_helpers.regions_get()
+    return [region.strip() for region in regions.split(",") if region.strip()]
+
+
+def create_all_or_nothing(create, delete, items, max_workers=REGION_WORKERS):
+    """Run create(item) concurrently for every item and return the results in item order.
+
+    create returns a (resource id, region) tuple, which is what delete receives.
+
+    If any creation fails, delete(result) is called for every item that was
+    created and a RuntimeError is raised, so a batch never leaves half of
+    its resources behind.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(create, item) for item in items]
+        created = []
+        errors = []
+        for future in futures:
+            try:
+                created.append(future.result())
+            except Exception as e:
+                errors.append(e)
+
+        if not errors:
+            return created
+
+        print(f"[!] {len(errors)} of {len(items)} resources failed, "
+              f"rolling back {len(created)} created resources")
+        rollbacks = [(result, pool.submit(delete, result)) for result in created]
+        for result, rollback_future in rollbacks:
+            try:
+                rollback_future.result()
+                print(f"[+] Rolled back {result[0]}")
+            except Exception as e:
+                print(f"[!] Rollback of {result[0]} failed: {e}")
+    raise RuntimeError(f"[!] Error creating resources: {errors[0]}")
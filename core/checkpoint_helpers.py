@@ -0,0 +1,175 @@
+"""Persisted scan checkpoint so repeat detection runs only process new CloudTrail files."""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Iterable, Optional
+
+CHECKPOINT_FILE = os.path.join("logs_detections", "scan_checkpoint.json")
+
+# S3 listing cursors (account / region prefix -> last key seen) of `detect watch`
+WATCH_CURSORS_FILE = os.path.join("logs_detections", "watch_cursors.json")
+
+# LookupEvents cursors (region -> end of the last poll and event ids seen) of `detect lookup`
+LOOKUP_CURSORS_FILE = os.path.join("logs_detections", "lookup_cursors.json")
+
+# Written next to the downloaded logs: local file name -> S3 key, ETag and size
+OBJECTS_INDEX_FILE = "objects.json"
+
+# Time CloudTrail stamps log files with (<account>_CloudTrail_<region>_20240101T0005Z_<id>.json.gz)
+CLOUDTRAIL_KEY_TIME = re.compile(r"_CloudTrail_[a-z0-9-]+_(\d{8}T\d{4})Z")
+
+# Scanned files stamped more than this many seconds before the oldest file of a
+# run are dropped from the checkpoint. Matches the CloudTrail delivery window the
+# watch cursors lag by, so files a later poll lists again are still skipped
+CHECKPOINT_MARGIN = 900
+
+
+def write_json_atomic(path: str, data: Any):
+    """Write JSON to a temp file in the same directory and rename it over path."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def ruleset_fingerprint(rules_text: str, snares_list: List[str]) -> str:
+    """Hash of the raw rules YAML and the snares list.
+
+    A checkpoint is only valid for the same hash.
+    """
+    payload = json.dumps({"rules": rules_text, "snares": sorted(snares_list or [])}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(fingerprint: str, checkpoint_file: str = CHECKPOINT_FILE) -> Dict[str, Dict]:
+    """Return the scanned files recorded for this fingerprint, keyed by S3 key.
+
+    Returns an empty checkpoint if none exists or the rules / snares changed.
+    """
+    try:
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    if checkpoint.get("fingerprint") != fingerprint:
+        print("[+] Detection rules or snares changed since the last run, rescanning all files")
+        return {}
+    return checkpoint.get("files", {})
+
+
+def save_checkpoint(fingerprint: str, files: Dict[str, Dict],
+                    checkpoint_file: str = CHECKPOINT_FILE):
+    write_json_atomic(checkpoint_file, {"fingerprint": fingerprint, "files": files})
+
+
+def key_time(s3_key: str) -> Optional[datetime]:
+    """Time a CloudTrail log key or file name is stamped with (None if it has none)."""
+    match = CLOUDTRAIL_KEY_TIME.search(s3_key)
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%dT%H%M").replace(tzinfo=timezone.utc)
+
+
+def prune_checkpoint(files: Dict[str, Dict], s3_keys: Iterable[str],
+                     margin: int = CHECKPOINT_MARGIN) -> int:
+    """Drop scanned files stamped more than margin seconds before the oldest of s3_keys.
+
+    s3_keys are the files of the current run, so the checkpoint only keeps its
+    window (files of an older window are scanned again if it is rerun). Keys
+    without a CloudTrail timestamp are kept. Returns the number of files dropped.
+    """
+    stamps = [stamp for stamp in map(key_time, s3_keys) if stamp is not None]
+    if not stamps:
+        return 0
+    cutoff = min(stamps) - timedelta(seconds=margin)
+    expired = [key for key in files if (key_time(key) or cutoff) < cutoff]
+    for key in expired:
+        del files[key]
+    return len(expired)
+
+
+def is_scanned(files: Dict[str, Dict], s3_key: str, etag: Optional[str], size: int) -> bool:
+    """Check if this exact object version was already scanned."""
+    entry = files.get(s3_key)
+    if entry is None:
+        return False
+    if etag and entry.get("etag"):
+        return entry["etag"] == etag
+    return entry.get("size") == size
+
+
+def mark_scanned(files: Dict[str, Dict], s3_key: str, etag: Optional[str], size: int):
+    files[s3_key] = {
+        "etag": etag,
+        "size": size,
+        "scanned_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def load_watch_cursors(bucket_name: str, cursors_file: str = WATCH_CURSORS_FILE) -> Dict[str, str]:
+    """Return the saved prefix -> last key cursors for a trail bucket."""
+    try:
+        with open(cursors_file, "r", encoding="utf-8") as f:
+            return json.load(f).get(bucket_name, {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_watch_cursors(bucket_name: str, cursors: Dict[str, str],
+                       cursors_file: str = WATCH_CURSORS_FILE):
+    try:
+        with open(cursors_file, "r", encoding="utf-8") as f:
+            all_cursors = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        all_cursors = {}
+    all_cursors[bucket_name] = cursors
+    write_json_atomic(cursors_file, all_cursors)
+
+
+def load_lookup_cursors(account_id: str,
+                        cursors_file: str = LOOKUP_CURSORS_FILE) -> Dict[str, Dict]:
+    """Return the saved region -> LookupEvents cursor of an account."""
+    return load_watch_cursors(account_id, cursors_file)
+
+
+def save_lookup_cursors(account_id: str, cursors: Dict[str, Dict],
+                        cursors_file: str = LOOKUP_CURSORS_FILE):
+    save_watch_cursors(account_id, cursors, cursors_file)
+
+
+def load_objects_index(directory: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(directory, OBJECTS_INDEX_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def update_objects_index(directory: str, entries: Dict[str, Dict]):
+    """Record the S3 key, ETag and size of downloaded files by local file name."""
+    index = load_objects_index(directory)
+    index.update(entries)
+    write_json_atomic(os.path.join(directory, OBJECTS_INDEX_FILE), index)
+
+
+def local_file_source(directory: str, filename: str, index: Dict[str, Dict]) -> Dict:
+    """S3 key, ETag and size for a local log file (its file name if it was not downloaded by us)."""
+    entry = index.get(filename)
+    if entry is not None:
+        return entry
+    return {
+        "s3_key": filename,
+        "etag": None,
+        "size": os.path.getsize(os.path.join(directory, filename)),
+    }
@@ -1,20 +1,90 @@
+import copy
+import os
+import tempfile
+import threading
 import yaml
-from typing import List
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, fall back to the in-process lock only
+    fcntl = None
 
 SETTINGLS_FILE = "config.yaml"
 
+# Parsed settings, reused until the file's mtime or size changes
+_settings_cache = {"stamp": None, "settings": {}}
+_settings_thread_lock = threading.RLock()
+
 AWS_regions = ["us-east-1","us-east-2","us-west-1","us-west-2","af-south-1","ap-east-1","ap-south-2","ap-southeast-3","ap-southeast-5","ap-southeast-4","ap-south-1","ap-northeast-3","ap-northeast-2","ap-southeast-1","ap-southeast-2","ap-east-2","ap-southeast-7","ap-northeast-1","ca-central-1","ca-west-1","eu-central-1","eu-west-1","eu-west-2","eu-south-1","eu-west-3","eu-south-2","eu-north-1","eu-central-2","il-central-1","mx-central-1","me-south-1","me-central-1","sa-east-1"]
 
-def load_settings():
+def _settings_stamp():
     try:
-        with open(SETTINGLS_FILE, "r") as f:
-            return yaml.safe_load(f) or {}
+        stat = os.stat(SETTINGLS_FILE)
     except FileNotFoundError:
-        return {}
+        return None
+    return (SETTINGLS_FILE, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def load_settings():
+    """Return the settings, parsing config.yaml only when it changed since the last read.
+
+    A copy is returned so callers can modify it before save_settings().
+    """
+    with _settings_thread_lock:
+        stamp = _settings_stamp()
+        if stamp is None:
+            return {}
+        if stamp != _settings_cache["stamp"]:
+            with open(SETTINGLS_FILE, "r") as f:
+                _settings_cache["settings"] = yaml.safe_load(f) or {}
+            _settings_cache["stamp"] = stamp
+        return copy.deepcopy(_settings_cache["settings"])
 
 def save_settings(settings):
-    with open(SETTINGLS_FILE, "w") as f:
-        yaml.dump(settings, f, default_flow_style=False)
+    """Atomically replace config.yaml (temp file + rename), keeping its permissions."""
+    with _settings_thread_lock:
+        directory = os.path.dirname(os.path.abspath(SETTINGLS_FILE))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config_", suffix=".yaml")
+        try:
+            with os.fdopen(fd, "w") as f:
+                yaml.dump(settings, f, default_flow_style=False)
+            # mkstemp creates the file owner-only (0600); a new config.yaml keeps that
+            try:
+                os.chmod(tmp_path, os.stat(SETTINGLS_FILE).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, SETTINGLS_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        _settings_cache["settings"] = copy.deepcopy(settings)
+        _settings_cache["stamp"] = _settings_stamp()
+
+@contextmanager
+def settings_lock():
+    """Lock config.yaml against other threads and other AWSnare processes."""
+    with _settings_thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(SETTINGLS_FILE + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+@contextmanager
+def update_settings():
+    """Read-modify-write the settings under the config lock.
+
+    with update_settings() as settings:
+        settings["key"] = value
+    """
+    with settings_lock():
+        settings = load_settings()
+        yield settings
+        save_settings(settings)
 
 def config_print():
     """Print current configuration settings."""
@@ -32,14 +102,10 @@ def AWSnare_tag_get():
 
 def default_region_set():
     """Set the default AWS region."""
-    settings = load_settings()
-
     while True:
         def_region = input("\nEnter new default AWS region (e.g., us-east-1): ").strip().lower()
 
         if def_region in AWS_regions:
-            settings["AWS_default_region"] = def_region
-            print(f"Default region set to: {def_region}")
             break
         elif def_region == "exit":
             print("Exiting without changes.")
@@ -48,7 +114,9 @@ def default_region_set():
             print("\nInvalid AWS region. Please enter a valid region from the following list:")
             print(", ".join(AWS_regions))
 
-    save_settings(settings)
+    with update_settings() as settings:
+        settings["AWS_default_region"] = def_region
+    print(f"Default region set to: {def_region}")
 
 def default_region_get():
     settings = load_settings()
@@ -72,11 +140,8 @@ def cloudtrail_name_get():
         return "No configured Cloudtrail. Please configure / create trail first."
 
 def cloudtrail_name_set(trail_name):
-    settings = load_settings()
-
-    settings["AWS_cloudtrail_name"] = trail_name
-
-    save_settings(settings)
+    with update_settings() as settings:
+        settings["AWS_cloudtrail_name"] = trail_name
 
 def account_id_get():
     settings = load_settings()
@@ -85,44 +150,31 @@ def account_id_get():
     else:
         return "No configured account id. Please configure account id first"
 
-def AWS_snares_arn_list_get() -> List:
-    settings = load_settings()
-    try:
-        return settings["AWS_snares_arn_list"]
-    except:
-        print("No configured account id. Please configure account id first")
-        return []
+def account_ids_get():
+    """Accounts whose CloudTrail logs are scanned.
 
-def AWS_snares_arn_list_add(arn: str):
+    AWS_account_ids if set, else the configured account.
+    """
     settings = load_settings()
+    return settings.get("AWS_account_ids") or [account_id_get()]
 
-    # Initialize the list if it doesn't exist
-    if "AWS_snares_arn_list" not in settings:
-        settings["AWS_snares_arn_list"] = []
-
-    settings["AWS_snares_arn_list"].append(arn)
-    save_settings(settings)
+def organization_id_get():
+    """Organization id of an organization trail, None for a single-account trail."""
+    return load_settings().get("AWS_organization_id")
 
-def AWS_snares_arn_list_remove(arn: str):
-    settings = load_settings()
-
-    settings["AWS_snares_arn_list"].remove(arn)
-    save_settings(settings)
+def organization_id_set(org_id):
+    with update_settings() as settings:
+        settings["AWS_organization_id"] = org_id
 
 def regions_add():
     """Add AWS region to AWS_all_regions."""
-    settings = load_settings()
-    # Initialize the list if it doesn't exist
-    if "AWS_configured_regions" not in settings:
-        settings["AWS_configured_regions"] = []
+    configured_regions = load_settings().get("AWS_configured_regions") or []
 
     while True:
         new_region = input("Enter new AWS region to add (e.g., us-east-1): ").strip().lower()
 
         if new_region in AWS_regions:
-            if new_region not in settings["AWS_configured_regions"]:
-                settings["AWS_configured_regions"].append(new_region)
-                print(f"✅ Region '{new_region}' added.")
+            if new_region not in configured_regions:
                 break
             else:
                 print("\nInvalid AWS region. Please enter a valid region from the following list:")
@@ -134,17 +186,20 @@ def regions_add():
             print("\nInvalid AWS region. Please enter a valid region from the following list:")
             print(", ".join(AWS_regions))
 
-    save_settings(settings)
+    with update_settings() as settings:
+        # Initialize the list if it doesn't exist
+        if "AWS_configured_regions" not in settings:
+            settings["AWS_configured_regions"] = []
+        if new_region not in settings["AWS_configured_regions"]:
+            settings["AWS_configured_regions"].append(new_region)
+    print(f"✅ Region '{new_region}' added.")
 
 def regions_remove():
-    settings = load_settings()
-
     rm_region = input("Enter AWS region to remove (e.g., us-east-1): ").strip().lower()
 
-    if "AWS_configured_regions" in settings and rm_region in settings["AWS_configured_regions"]:
-        settings["AWS_configured_regions"].remove(rm_region)
-        print(f"🗑️ Region '{rm_region}' removed.")
-    else:
-        print(f"⚠️ Region '{rm_region}' not found in list.")
-
-    save_settings(settings)
+    with update_settings() as settings:
+        if "AWS_configured_regions" in settings and rm_region in settings["AWS_configured_regions"]:
+            settings["AWS_configured_regions"].remove(rm_region)
+            print(f"🗑️ Region '{rm_region}' removed.")
+        else:
+            print(f"⚠️ Region '{rm_region}' not found in list.")
@@ -1,104 +1,1330 @@
+import fnmatch
+import codecs
 import gzip
+import importlib.util
 import json
+import operator
 import os
+import re
+import time
 import yaml
-from typing import List, Dict, Any
-from datetime import datetime
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Tuple, Iterator, Iterable, Callable, Optional, TextIO, BinaryIO
 
-from core import config_helpers
+from core import checkpoint_helpers
+from core import snare_registry_helpers
+from core import hits_helpers
+from core import stats_helpers
 
-def load_rules_from_yaml(rules_file: str) -> List[Dict[str, Any]]:
-    """Load detection rules from YAML."""
+RULES_FILE = "detection_rules.yaml"
+LOGS_DIR = "logs_cloudtrail"
+DETECTIONS_DIR = "logs_detections"
+
+# Amount of decompressed text read from a CloudTrail file at a time
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Decoder backends ("auto" picks the fastest one installed)
+JSON_BACKENDS = ("auto", "stdlib", "orjson")
+GZIP_BACKENDS = ("auto", "stdlib", "isal")
+
+# Extra isal threads decompressing each local file. Files are already
+# spread over worker processes, so 0 (decompress in the reader) is usually fastest
+GZIP_THREADS = 0
+
+# Threads fetching, decompressing and matching S3 objects in streaming mode
+STREAM_WORKERS = 8
+
+# Rule fields that are matched by exact value and used to index the rule set
+INDEXED_FIELDS = ("eventSource", "eventName")
+
+# Hit aggregation: grouping fields, window in seconds of event time and
+# maximum number of open groups
+AGGREGATION_KEY_FIELDS = ("rule", "principal", "sourceIP", "snare")
+AGGREGATION_WINDOW = 3600
+AGGREGATION_MAX_ENTRIES = 10000
+
+COMPARISON_OPERATORS = {
+    "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le,
+}
+
+
+class RuleSet:
+    """Detection rules indexed by their exact-match fields.
+
+    Rules are bucketed by the values they expect for INDEXED_FIELDS, so each
+    event is only tested against the rules that can possibly match it.
+    A rule that does not constrain an indexed field is stored under None
+    for that field and is a candidate for every value.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = list(rules)
+        self._index: Dict[Tuple, List[int]] = {}
+        self._compile()
+
+        for position, rule in enumerate(self.rules):
+            keys = [()]
+            for field in INDEXED_FIELDS:
+                expected = rule.get("logic", {}).get(field)
+                if expected is None or isinstance(expected, dict):
+                    # Operator conditions are checked by the predicate only
+                    values = [None]
+                elif isinstance(expected, list):
+                    values = expected
+                else:
+                    values = [expected]
+                keys = [key + (value,) for key in keys for value in values]
+            for key in keys:
+                self._index.setdefault(key, []).append(position)
+
+    def _compile(self):
+        # Exact-match indexed fields are already guaranteed by the index lookup
+        self._predicates = [
+            compile_logic(
+                rule.get("logic", {}), skip_fields=INDEXED_FIELDS, rule_name=rule.get("name")
+            )
+            for rule in self.rules
+        ]
+        self._candidates_cache: Dict[
+            Tuple, Tuple[Tuple[Dict[str, Any], Callable[[Dict], bool]], ...]
+        ] = {}
+
+    def __getstate__(self):
+        # Compiled predicates are closures, scan worker processes rebuild them
+        return {"rules": self.rules, "_index": self._index}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, event: Dict) -> Tuple[Dict[str, Any], ...]:
+        """Return the rules that can match the event, in rule file order."""
+        return tuple(rule for rule, _ in self.candidate_predicates(event))
+
+    def matching(self, event: Dict) -> Iterator[Dict[str, Any]]:
+        """Yield the rules the event matches, in rule file order."""
+        for rule, predicate in self.candidate_predicates(event):
+            if predicate(event):
+                yield rule
+
+    def candidate_predicates(
+        self, event: Dict
+    ) -> Tuple[Tuple[Dict[str, Any], Callable[[Dict], bool]], ...]:
+        """Return (rule, compiled predicate) of the rules that can match the event.
+
+        Rules come in rule file order.
+        """
+        event_key = tuple(event.get(field) for field in INDEXED_FIELDS)
+        cached = self._candidates_cache.get(event_key)
+        if cached is not None:
+            return cached
+
+        # Every combination of the event value and the None wildcard
+        lookup_keys = [()]
+        for value in event_key:
+            lookup_keys = (
+                [key + (value,) for key in lookup_keys] + [key + (None,) for key in lookup_keys]
+            )
+
+        positions = set()
+        for key in lookup_keys:
+            positions.update(self._index.get(key, ()))
+        cached = tuple(
+            (self.rules[position], self._predicates[position]) for position in sorted(positions)
+        )
+        self._candidates_cache[event_key] = cached
+        return cached
+
+
+def load_rules_from_yaml(rules_file: str) -> RuleSet:
+    """Load detection rules from YAML and compile them into an indexed RuleSet."""
     with open(rules_file, "r") as f:
-        rules_data = yaml.safe_load(f)
-    return rules_data.get("rules", [])
+        rules_data = yaml.safe_load(f) or {}
+    return RuleSet(rules_data.get("rules", []))
+
+
+def iter_records(stream: TextIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Dict]:
+    """Yield the entries of the "Records" array of a CloudTrail JSON document one at a time.
+
+    Only the record being decoded and one chunk of text are held in memory,
+    so memory use does not grow with the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    # Skip ahead to the opening bracket of the Records array
+    while True:
+        start = buffer.find('"Records"')
+        bracket = buffer.find("[", start) if start != -1 else -1
+        if bracket != -1:
+            buffer = buffer[bracket + 1:]
+            break
+        if eof:
+            return
+        if start == -1:
+            buffer = buffer[-len('"Records"'):]
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\n\r,":
+            pos += 1
+        if pos < len(buffer):
+            if buffer[pos] == "]":
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Incomplete record, read more below (a truncated file is an error)
+                if eof:
+                    raise
+            else:
+                yield record
+                continue
+        elif eof:
+            return
+
+        # Read at least as much as is already buffered so records larger than
+        # a chunk are not re-decoded from the start once per chunk
+        chunk = stream.read(max(chunk_size, len(buffer) - pos))
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+class Decoder:
+    """Decompression and JSON decoding backends for CloudTrail files.
+
+    Files are read in binary, STREAM_CHUNK_SIZE at a time. gzip_backend
+    "isal" uses python-isal and json_backend "orjson" decodes each file in
+    one call; "auto" picks them when installed and falls back to the
+    stdlib. The stdlib JSON backend streams records with constant memory,
+    orjson holds one decompressed file at a time.
+
+    With prescreen, iter_snare_records() searches the raw bytes of a file
+    for the snares first and only decodes the records that mention one,
+    also with constant memory.
+    """
+
+    def __init__(self, json_backend: str = "auto", gzip_backend: str = "auto",
+                 prescreen: bool = True):
+        if json_backend not in JSON_BACKENDS:
+            raise ValueError(
+                f"[!] Unknown JSON backend '{json_backend}', use one of {JSON_BACKENDS}"
+            )
+        if gzip_backend not in GZIP_BACKENDS:
+            raise ValueError(
+                f"[!] Unknown gzip backend '{gzip_backend}', use one of {GZIP_BACKENDS}"
+            )
+        self.json_backend = _resolve_backend(json_backend, "orjson", "orjson")
+        self.gzip_backend = _resolve_backend(gzip_backend, "isal", "isal.igzip")
+        self.prescreen = prescreen
+
+    def __repr__(self):
+        return (f"Decoder(json_backend={self.json_backend!r}, "
+                f"gzip_backend={self.gzip_backend!r}, prescreen={self.prescreen!r})")
+
+    def open_file(self, filepath: str) -> BinaryIO:
+        """Open a gzipped file as a decompressed binary stream."""
+        if self.gzip_backend == "isal":
+            if GZIP_THREADS:
+                from isal import igzip_threaded
+                return igzip_threaded.open(filepath, "rb", threads=GZIP_THREADS)
+            from isal import igzip
+            return igzip.open(filepath, "rb")
+        return gzip.open(filepath, "rb")
+
+    def open_fileobj(self, fileobj: BinaryIO) -> BinaryIO:
+        """Decompress a gzipped binary file object such as an S3 response body."""
+        if self.gzip_backend == "isal":
+            from isal import igzip
+            return igzip.IGzipFile(fileobj=fileobj, mode="rb")
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+
+    def iter_records(self, stream: BinaryIO) -> Iterator[Dict]:
+        """Yield the records of a decompressed binary CloudTrail stream."""
+        if self.json_backend == "orjson":
+            import orjson
+            yield from orjson.loads(stream.read()).get("Records") or []
+            return
+
+        yield from iter_records(_Utf8Reader(stream))
+
+    def loads_records(self, data: bytes) -> List[Dict]:
+        """Decode all records of a decompressed CloudTrail file held in memory."""
+        if self.json_backend == "orjson":
+            import orjson
+            return orjson.loads(data).get("Records") or []
+        return json.loads(data).get("Records") or []
+
+    def iter_snare_records(self, stream: BinaryIO, snares: "SnareMatcher") -> Iterator[Dict]:
+        """Yield the records of a stream that can touch a snare, all records without prescreen."""
+        if not self.prescreen:
+            return self.iter_records(stream)
+        return iter_prescreen_records(stream, snares, self)
+
+
+# Every record CloudTrail writes starts with its eventVersion
+RECORD_START = b'{"eventVersion"'
+
+
+def iter_prescreen_records(stream: BinaryIO, snares: "SnareMatcher",
+                           decoder: Optional[Decoder] = None,
+                           chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Dict]:
+    """Yield only the records of a decompressed CloudTrail stream that mention a snare.
+
+    The raw bytes are searched chunk_size at a time. Between chunks only
+    the start of the current record and a tail as long as the longest
+    snare needle are kept, so memory stays bounded by a chunk plus a
+    record. Stretches where the snare pattern never occurs are not parsed
+    at all. For each match, the enclosing record is found by the
+    RECORD_START marker and decoded up to the next marker. Records found
+    there that do not start with the marker (other key order) are decoded
+    along with it, so a file whose first record is the only one starting
+    with it is still read in full, just without the memory bound. A first
+    chunk without the marker (pretty-printed) is decoded in full instead.
+    """
+    pattern = snares.prescreen_pattern
+    if pattern is None:
+        return
+    json_decoder = json.JSONDecoder()
+    data = stream.read(chunk_size)
+    eof = not data
+    decoder = decoder or get_decoder()
+    if not eof and RECORD_START not in data:
+        yield from decoder.iter_records(_PrefixedReader(data, stream))
+        return
+
+    # Matches before pos are handled; dropped is set once data no longer
+    # starts at the top of the file
+    pos = 0
+    dropped = False
+    while True:
+        match = pattern.search(data, pos)
+        if match is not None:
+            next_start = data.find(RECORD_START, match.end())
+            if next_start != -1 or eof:
+                end = next_start if next_start != -1 else len(data)
+                records = _decode_records(json_decoder, data, match.start(), match.end(), end)
+                if records is not None:
+                    yield from records
+                    data, pos, dropped = data[end:], 0, True
+                    continue
+                if not dropped:
+                    yield from decoder.iter_records(_PrefixedReader(data, stream))
+                    return
+                print("[!] A record mentioning a snare could not be isolated, "
+                      "rerun with --no-prescreen to decode the file in full")
+                pos = match.end()
+                continue
+            # The record goes on in the next chunk
+        elif eof:
+            return
+        else:
+            # Keep the start of the current record and the tail a needle could straddle
+            tail = max(pos, len(data) - snares.prescreen_overlap)
+            keep = min(data.rfind(RECORD_START), tail)
+            if keep > 0:
+                data, dropped = data[keep:], True
+            pos = tail - max(keep, 0)
+
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        data += chunk
+
+
+def _decode_records(json_decoder: json.JSONDecoder, data: bytes, match_start: int,
+                    match_end: int, end: int) -> Optional[List[Dict]]:
+    """Decode the records of data[:end] from the marker before the match.
+
+    Returns None if the match can not be isolated in whole records.
+    """
+    start = data.rfind(RECORD_START, 0, match_start)
+    if start == -1:
+        return None
+    records = []
+    try:
+        text = data[start:end].decode("utf-8")
+        pos = 0
+        while True:
+            record, length = json_decoder.raw_decode(text, pos)
+            records.append(record)
+            pos = length
+            while pos < len(text) and text[pos] in " \t\n\r,":
+                pos += 1
+            # Up to the next marker, or the end of the Records array
+            if pos == len(text) or text[pos] == "]":
+                break
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    if start + len(text[:length].encode("utf-8")) < match_end:
+        # The marker belonged to a nested object, not to a record
+        return None
+    return records
+
+
+class _PrefixedReader:
+    """Binary stream returning bytes already read from another stream before the rest of it."""
+
+    def __init__(self, prefix: bytes, stream: BinaryIO):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            return self._stream.read(size)
+        if size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+
+class _Utf8Reader:
+    """Text view of a binary stream, decoded from the large reads iter_records() makes."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read(self, size: int = -1) -> str:
+        while True:
+            data = self._stream.read(size)
+            text = self._decoder.decode(data, final=not data)
+            # A read ending inside a multi-byte character decodes to nothing yet
+            if text or not data:
+                return text
+
+
+def _resolve_backend(name: str, optional: str, module: str) -> str:
+    if name == "auto":
+        return optional if importlib.util.find_spec(module.split(".")[0]) is not None else "stdlib"
+    if name == optional and importlib.util.find_spec(module.split(".")[0]) is None:
+        package = module.split(".")[0]
+        raise RuntimeError(
+            f"[!] The {optional} backend needs the '{package}' package: pip install {package}"
+        )
+    return name
+
+
+_decoder: Optional[Decoder] = None
+
+
+def get_decoder() -> Decoder:
+    """The decoder used for CloudTrail files, auto-detected on first use."""
+    global _decoder
+    if _decoder is None:
+        _decoder = Decoder()
+    return _decoder
+
+
+def set_decoder(decoder: Decoder):
+    global _decoder
+    _decoder = decoder
+
+
+def iter_cloudtrail_file(filepath: str) -> Iterator[Dict]:
+    """Stream the records of a gzipped CloudTrail log file as they are decompressed."""
+    decoder = get_decoder()
+    with decoder.open_file(filepath) as f:
+        yield from decoder.iter_records(f)
 
 
 def load_cloudtrail_file(filepath: str) -> List[Dict]:
     """Load and parse a gzipped CloudTrail log file."""
-    with gzip.open(filepath, "rt") as f:
-        data = json.load(f)
-        return data.get("Records", [])
+    return list(iter_cloudtrail_file(filepath))
 
 
-def event_matches_rule(event: Dict, logic: Dict[str, Any], snares_list: List) -> bool:
-    """Check if a CloudTrail event matches a rule's logic."""
-    # Check if any ARN from snares_list is present in the event (pre-filtering)
-    for arn in snares_list:
-        if arn in str(event):
-            break
-    else:
-        return False
-    # Check if any detection logic matches
-    for field, expected in logic.items():
-        value = event.get(field)
-        if isinstance(expected, list):
-            if value not in expected:
+class SnareMatcher:
+    """Match CloudTrail events against the configured snare ARNs.
+
+    Built once per scan from the snares list. Candidate resource identifiers
+    are pulled from the structured event fields and checked with set lookups,
+    so each event costs a handful of hash lookups regardless of how many
+    snares are configured.
+    """
+
+    def __init__(self, snares_list: List[str], substring_fallback: bool = False):
+        self.arns = set()
+        self.bucket_names = set()
+        self.secret_names = set()
+
+        for arn in snares_list or []:
+            self.arns.add(arn)
+            if arn.startswith("arn:aws:s3:::"):
+                self.bucket_names.add(arn[len("arn:aws:s3:::"):].split("/", 1)[0])
+            elif ":secretsmanager:" in arn and ":secret:" in arn:
+                secret_name = arn.split(":secret:", 1)[1]
+                self.secret_names.add(secret_name)
+                # Secret ARNs end with a random "-XXXXXX" suffix the name does not carry
+                self.secret_names.add(secret_name.rsplit("-", 1)[0])
+
+        # Raw-byte search for any snare in a decompressed file, before JSON parsing.
+        # Bucket and secret names cover their ARNs, bucketName and secretId
+        needles = set(self.bucket_names)
+        needles.update(name.rsplit("-", 1)[0] for name in self.secret_names)
+        needles.update(
+            arn for arn in self.arns
+            if not arn.startswith("arn:aws:s3:::") and ":secret:" not in arn
+        )
+        self.prescreen_pattern = None
+        # Bytes a chunked search keeps from the previous chunk, so no needle is split
+        self.prescreen_overlap = 0
+        if needles:
+            ordered = sorted((needle.encode("utf-8") for needle in needles), key=len, reverse=True)
+            self.prescreen_pattern = re.compile(b"|".join(re.escape(needle) for needle in ordered))
+            self.prescreen_overlap = len(ordered[0]) - 1
+
+        # Optional single-pass search over the whole event for unstructured fields
+        self._fallback_pattern = None
+        if substring_fallback and self.arns:
+            patterns = sorted(self.arns, key=len, reverse=True)
+            self._fallback_pattern = re.compile("|".join(re.escape(p) for p in patterns))
+
+    def __bool__(self):
+        return bool(self.arns)
+
+    def _snare_for_arn(self, arn: str) -> Optional[str]:
+        if arn in self.arns:
+            return arn
+        if arn.startswith("arn:aws:s3:::"):
+            # Object ARNs (bucket/key) belong to the snare bucket
+            bucket_name = arn[len("arn:aws:s3:::"):].split("/", 1)[0]
+            return f"arn:aws:s3:::{bucket_name}" if bucket_name in self.bucket_names else None
+        if ":secret:" in arn and arn.split(":secret:", 1)[1] in self.secret_names:
+            return arn
+        return None
+
+    def match(self, event: Dict) -> Optional[str]:
+        """Return the snare (bucket ARN, secret ARN or name) the event touches, or None."""
+        if not self.arns:
+            return None
+
+        for resource in event.get("resources") or []:
+            arn = resource.get("ARN")
+            if arn:
+                snare = self._snare_for_arn(arn)
+                if snare is not None:
+                    return snare
+
+        params = event.get("requestParameters") or {}
+        if isinstance(params, dict):
+            bucket_name = params.get("bucketName")
+            if bucket_name and bucket_name in self.bucket_names:
+                return f"arn:aws:s3:::{bucket_name}"
+            secret_id = params.get("secretId")
+            if secret_id:
+                if secret_id in self.secret_names:
+                    return secret_id
+                snare = self._snare_for_arn(secret_id)
+                if snare is not None:
+                    return snare
+
+        if self._fallback_pattern is not None:
+            found = self._fallback_pattern.search(str(event))
+            return found.group(0) if found else None
+        return None
+
+    def matches(self, event: Dict) -> bool:
+        """Check if the event touches any snare resource."""
+        return self.match(event) is not None
+
+
+def _field_getter(path: str) -> Callable[[Dict], Any]:
+    """Return a function reading a dotted field path from an event.
+
+    E.g. "userIdentity.arn" or "resources.0.ARN".
+    """
+    parts = [int(part) if part.isdigit() else part for part in path.split(".")]
+
+    def get(event: Dict) -> Any:
+        value = event
+        for part in parts:
+            if isinstance(value, dict):
+                value = value.get(part)
+            elif isinstance(value, list) and isinstance(part, int) and part < len(value):
+                value = value[part]
+            else:
+                return None
+        return value
+    return get
+
+
+def _to_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    if isinstance(value, str):
+        return _to_datetime(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    raise TypeError(f"not a time: {value!r}")
+
+
+def _as_tuple(argument: Any) -> Tuple:
+    return tuple(argument) if isinstance(argument, list) else (argument,)
+
+
+def _compile_comparison(operator_name: str, bound: Any) -> Callable[[Any], bool]:
+    compare = COMPARISON_OPERATORS[operator_name]
+    if isinstance(bound, (int, float)) and not isinstance(bound, bool):
+        def test_number(value):
+            try:
+                return compare(float(value), bound)
+            except (TypeError, ValueError):
                 return False
+        return test_number
+
+    # Anything else is a point in time: a YAML timestamp, date or ISO 8601 string
+    bound = _to_datetime(bound)
+
+    def test_time(value):
+        try:
+            return compare(_to_datetime(value), bound)
+        except (TypeError, ValueError):
+            return False
+    return test_time
+
+
+def _compile_operator(operator_name: str, argument: Any) -> Callable[[Any], bool]:
+    if operator_name == "equals":
+        return lambda value: value == argument
+    if operator_name == "in":
+        return _compile_condition(list(_as_tuple(argument)))
+    if operator_name in ("prefix", "suffix", "contains"):
+        options = tuple(str(option) for option in _as_tuple(argument))
+        if operator_name == "prefix":
+            return lambda value: isinstance(value, str) and value.startswith(options)
+        if operator_name == "suffix":
+            return lambda value: isinstance(value, str) and value.endswith(options)
+        return lambda value: isinstance(value, str) and any(option in value for option in options)
+    if operator_name in ("wildcard", "regex"):
+        if operator_name == "wildcard":
+            pattern = re.compile(
+                "|".join(fnmatch.translate(str(option)) for option in _as_tuple(argument))
+            )
+            search = pattern.match
         else:
-            if value != expected:
+            search = re.compile("|".join(f"(?:{option})" for option in _as_tuple(argument))).search
+        return lambda value: isinstance(value, str) and search(value) is not None
+    if operator_name == "not":
+        test = _compile_condition(argument)
+        return lambda value: not test(value)
+    if operator_name == "exists":
+        expected = bool(argument)
+        return lambda value: (value is not None) == expected
+    if operator_name in COMPARISON_OPERATORS:
+        return _compile_comparison(operator_name, argument)
+    raise ValueError(f"unknown operator '{operator_name}'")
+
+
+def _membership(values: List[Any]):
+    try:
+        return frozenset(values)
+    except TypeError:
+        # Unhashable values (nested objects) fall back to a list scan
+        return values
+
+
+def _compile_condition(expected: Any) -> Callable[[Any], bool]:
+    """Compile the condition on one field: a value, a list of values or a dict of operators."""
+    if isinstance(expected, list):
+        options = _membership(expected)
+        return lambda value: value in options
+    if not isinstance(expected, dict):
+        return lambda value: value == expected
+
+    tests = [
+        _compile_operator(operator_name, argument)
+        for operator_name, argument in expected.items()
+    ]
+    if len(tests) == 1:
+        return tests[0]
+    return lambda value: all(test(value) for test in tests)
+
+
+def compile_logic(logic: Dict[str, Any], skip_fields: Iterable[str] = (),
+                  rule_name: Optional[str] = None) -> Callable[[Dict], bool]:
+    """Compile a rule's logic into a predicate on events.
+
+    Every field must match. Field names may be dotted paths into nested
+    objects. A field's condition is either a value (equality), a list of
+    values (membership) or a dict of operators that must all hold:
+    equals, in, prefix, suffix, contains, wildcard, regex, not, exists,
+    gt, gte, lt, lte (numbers, or times for timestamps / ISO 8601 strings).
+    Fields in skip_fields are left out when they are matched exactly,
+    because the caller has already checked them.
+    """
+    skip_fields = set(skip_fields)
+    exact: List[Tuple[str, Any]] = []
+    members: List[Tuple[str, Any]] = []
+    checks: List[Tuple[Callable[[Dict], Any], Callable[[Any], bool]]] = []
+
+    for field, expected in logic.items():
+        top_level = "." not in field
+        if top_level and field in skip_fields and not isinstance(expected, dict):
+            continue
+        try:
+            if top_level and isinstance(expected, list):
+                members.append((field, _membership(expected)))
+            elif top_level and not isinstance(expected, dict):
+                exact.append((field, expected))
+            else:
+                checks.append((_field_getter(field), _compile_condition(expected)))
+        except (ValueError, TypeError, re.error) as e:
+            raise ValueError(
+                f"[!] Invalid condition on '{field}' in rule '{rule_name}': {e}"
+            ) from e
+
+    exact = tuple(exact)
+    members = tuple(members)
+    checks = tuple(checks)
+
+    # Plain equality and membership are tested inline, as before rules were compiled
+    def predicate(event: Dict) -> bool:
+        for field, expected in exact:
+            if event.get(field) != expected:
+                return False
+        for field, options in members:
+            if event.get(field) not in options:
+                return False
+        for get, test in checks:
+            if not test(get(event)):
                 return False
-    return True
-
-
-def scan_file(filepath: str, rules: List[Dict[str, Any]], snares_list: List) -> List[Dict]:
-    """Scan a single CloudTrail .gz file for rule matches."""
-    events = load_cloudtrail_file(filepath)
-    hits = []
-
-    for event in events:
-        for rule in rules:
-            if event_matches_rule(event, rule["logic"], snares_list):
-                hits.append(event)
-                print(f"\n[{rule["name"]}]\n"
-                    f"{rule["description"]}\n"
-                    f"- eventTime: {event.get('eventTime')}\n"
-                    f"- awsRegion: {event.get('awsRegion')}\n"
-                    f"- eventName: {event.get('eventName')}\n"
-                    f"- sourceIPAddress: {event.get('sourceIPAddress')}\n" 
-                    f"- userAgent: {event.get('userAgent')}\n"
-                    f"- userIdentity: {event.get("userIdentity", {}).get("arn")}"
-                )
-                if event["userIdentity"].get("userName"):
-                    print(f"- userName: {event['userIdentity']['userName']}")
-                if event.get("resources") and event["resources"][0].get("ARN"):
-                    print(f"- resource[0]: {event['resources'][0]['ARN']}")
-                if event.get("resources") and event["resources"][0].get("ARN"):
-                    print(f"- resource[1]: {event['resources'][1]['ARN']}")
-                if event.get("requestParameters") and event["requestParameters"].get("secretId"):
-                    print(f"- requestParameters: {event['requestParameters']['secretId']}")
-    return hits
-
-
-def scan_directory(directory: str, rules: List[Dict[str, Any]], snares_list: List) -> List[Dict]:
+        return True
+    return predicate
+
+
+def event_matches_rule(event: Dict, logic: Dict[str, Any]) -> bool:
+    """Check if a CloudTrail event matches a rule's logic.
+
+    Compiles the logic on every call, use RuleSet.matching() for scanning.
+    """
+    return compile_logic(logic)(event)
+
+
+def print_hit(rule: Dict[str, Any], event: Dict):
+    """Print a rule match to the console."""
+    user_identity = event.get("userIdentity") or {}
+    resources = event.get("resources") or []
+    request_parameters = event.get("requestParameters") or {}
+
+    print(f"\n[{rule['name']}]\n"
+        f"{rule['description']}\n"
+        f"- eventTime: {event.get('eventTime')}\n"
+        f"- account: {event.get('recipientAccountId')}\n"
+        f"- awsRegion: {event.get('awsRegion')}\n"
+        f"- eventName: {event.get('eventName')}\n"
+        f"- sourceIPAddress: {event.get('sourceIPAddress')}\n"
+        f"- userAgent: {event.get('userAgent')}\n"
+        f"- userIdentity: {user_identity.get('arn')}"
+    )
+    if user_identity.get("userName"):
+        print(f"- userName: {user_identity['userName']}")
+    if len(resources) > 0 and resources[0].get("ARN"):
+        print(f"- resource[0]: {resources[0]['ARN']}")
+    if len(resources) > 1 and resources[1].get("ARN"):
+        print(f"- resource[1]: {resources[1]['ARN']}")
+    if isinstance(request_parameters, dict) and request_parameters.get("secretId"):
+        print(f"- requestParameters: {request_parameters['secretId']}")
+
+
+def iter_event_matches(
+    events: Iterable[Dict], rules: RuleSet, snares: SnareMatcher,
+    timer: Optional["_MatchTimer"] = None,
+) -> Iterator[Tuple[int, Dict[str, Any], Dict]]:
+    """Yield (record index, rule, event) for every rule match in a sequence of events.
+
+    With a timer, the time spent getting and matching each event and the
+    per-rule counts are recorded in it.
+    """
+    if timer is not None:
+        events = timer.events(events)
+    for index, event in enumerate(events):
+        # Each event is checked against the snares once, not once per rule
+        candidates = rules.candidate_predicates(event) if snares.matches(event) else ()
+        matched = [rule for rule, predicate in candidates if predicate(event)]
+        if timer is not None:
+            # Hits are yielded outside the timed sections, reporting is a stage of its own
+            timer.matched(candidates, matched)
+        for rule in matched:
+            yield index, rule, event
+
+
+class _MatchTimer:
+    """Stage hooks of iter_event_matches(): time to get and to match events, per-rule counts."""
+
+    def __init__(self):
+        self.next_wall = self.next_cpu = 0.0
+        self.match_wall = self.match_cpu = 0.0
+        self.records = 0
+        self.newest: Optional[str] = None
+        self.evaluations: Dict[str, int] = {}
+        self.hits: Dict[str, int] = {}
+        self._wall = self._cpu = 0.0
+
+    def events(self, events: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass events through, timing each next(). Matching starts when an event is handed out."""
+        events = iter(events)
+        while True:
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            event = next(events, None)
+            self._wall, self._cpu = time.perf_counter(), time.thread_time()
+            self.next_wall += self._wall - wall_start
+            self.next_cpu += self._cpu - cpu_start
+            if event is None:
+                return
+            self.records += 1
+            event_time = event.get("eventTime")
+            if isinstance(event_time, str) and (self.newest is None or event_time > self.newest):
+                self.newest = event_time
+            yield event
+
+    def matched(self, candidates: Iterable[Tuple[Dict[str, Any], Callable[[Dict], bool]]],
+                matched: List[Dict[str, Any]]):
+        for rule, _ in candidates:
+            self.evaluations[rule["name"]] = self.evaluations.get(rule["name"], 0) + 1
+        for rule in matched:
+            self.hits[rule["name"]] = self.hits.get(rule["name"], 0) + 1
+        self.match_wall += time.perf_counter() - self._wall
+        self.match_cpu += time.thread_time() - self._cpu
+
+
+class _TimedStream:
+    """Binary stream wrapper adding up the time and bytes spent in read()."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        chunk = self._stream.read(size)
+        self.wall += time.perf_counter() - wall_start
+        self.cpu += time.thread_time() - cpu_start
+        self.bytes += len(chunk)
+        return chunk
+
+
+def _iter_stream_matches_timed(
+    stream: BinaryIO, rules: RuleSet, snares: SnareMatcher
+) -> Iterator[Tuple[int, Dict[str, Any], Dict]]:
+    """iter_stream_matches() recording decompress / parse / match times and per-rule counts."""
+    timed_stream = _TimedStream(stream)
+    decoder = get_decoder()
+    # The prescreen decodes the records it lets through, it replaces the parse stage
+    decode_stage = "prescreen" if decoder.prescreen else "parse"
+    timer = _MatchTimer()
+    try:
+        events = decoder.iter_snare_records(timed_stream, snares)
+        yield from iter_event_matches(events, rules, snares, timer)
+    finally:
+        stats = stats_helpers.STATS
+        stats.add("decompress", timed_stream.wall, timed_stream.cpu, size=timed_stream.bytes)
+        # Reads happen inside next(), so they are taken out of the parse time
+        stats.add(decode_stage, timer.next_wall - timed_stream.wall,
+                  timer.next_cpu - timed_stream.cpu, timer.records,
+                  timed_stream.bytes if decoder.prescreen else 0)
+        stats.add("match", timer.match_wall, timer.match_cpu, timer.records)
+        stats.add_rules(timer.evaluations, timer.hits)
+        stats.add_file(timer.newest)
+
+
+def iter_stream_matches(
+    stream: BinaryIO, rules: RuleSet, snares: SnareMatcher
+) -> Iterator[Tuple[int, Dict[str, Any], Dict]]:
+    """Yield (record index, rule, event) for every rule match in a decompressed binary stream."""
+    if stats_helpers.STATS.enabled:
+        return _iter_stream_matches_timed(stream, rules, snares)
+    return iter_event_matches(get_decoder().iter_snare_records(stream, snares), rules, snares)
+
+
+def iter_file_matches(
+    filepath: str, rules: RuleSet, snares: SnareMatcher
+) -> Iterator[Tuple[int, Dict[str, Any], Dict]]:
+    """Yield (record index, rule, event) for every rule match in a CloudTrail .gz file."""
+    with get_decoder().open_file(filepath) as f:
+        yield from iter_stream_matches(f, rules, snares)
+
+
+def report_hit(rule: Dict[str, Any], event: Dict, writer: Optional[hits_helpers.HitWriter] = None):
+    """Print a hit and append it to the hits output.
+
+    With a HitAggregator as writer, repeats of a hit are folded into a summary.
+    """
+    if stats_helpers.STATS.enabled:
+        with stats_helpers.STATS.stage("report", time.thread_time) as counters:
+            _report_hit(rule, event, writer)
+            counters["records"] = 1
+    else:
+        _report_hit(rule, event, writer)
+
+
+def _report_hit(rule: Dict[str, Any], event: Dict, writer: Optional[hits_helpers.HitWriter]):
+    if isinstance(writer, HitAggregator):
+        writer.report(rule, event)
+        return
+    print_hit(rule, event)
+    if writer is not None:
+        writer.write(rule, event)
+
+
+class HitAggregator:
+    """Collapse repeated hits into one alert plus a summary with counts.
+
+    Hits are grouped on key_fields ("rule", "snare", "principal",
+    "sourceIP", "account" or any dotted event path) within a window of event time.
+    The first hit of a group is reported in full straight away; later hits
+    only bump the group's count and first/last seen times. When the window
+    has passed, when the group is evicted as least recently used, or on
+    close(), a summary is printed and written if there were repeats. At
+    most max_entries groups are kept, so memory stays bounded under a burst.
+    """
+
+    KEY_ALIASES = {
+        "principal": "userIdentity.arn",
+        "sourceIP": "sourceIPAddress",
+        "account": "recipientAccountId",
+    }
+
+    def __init__(self, writer: Optional[hits_helpers.HitWriter], snares: SnareMatcher,
+                 key_fields: Iterable[str] = AGGREGATION_KEY_FIELDS,
+                 window: int = AGGREGATION_WINDOW,
+                 max_entries: int = AGGREGATION_MAX_ENTRIES):
+        self.writer = writer
+        self.snares = snares
+        self.key_fields = tuple(key_fields)
+        self.window = timedelta(seconds=window)
+        self.max_entries = max_entries
+        self.alert_count = 0
+        self.summary_count = 0
+        self._getters = [
+            None if field in ("rule", "snare")
+            else _field_getter(self.KEY_ALIASES.get(field, field))
+            for field in self.key_fields
+        ]
+        self._groups: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._latest: Optional[datetime] = None
+        # Earliest first-seen time among the groups, so _expire only scans when one can have expired
+        self._oldest: Optional[datetime] = None
+
+    @property
+    def files(self) -> List[str]:
+        return self.writer.files if self.writer is not None else []
+
+    def _key(self, rule: Dict[str, Any], event: Dict) -> Tuple:
+        key = []
+        for field, get in zip(self.key_fields, self._getters):
+            if field == "rule":
+                key.append(rule["name"])
+            elif field == "snare":
+                key.append(self.snares.match(event))
+            else:
+                key.append(get(event))
+        return tuple(key)
+
+    def report(self, rule: Dict[str, Any], event: Dict):
+        try:
+            event_time = _to_datetime(event.get("eventTime"))
+        except (TypeError, ValueError):
+            event_time = datetime.now(timezone.utc)
+        if self._latest is None or event_time > self._latest:
+            self._latest = event_time
+        if self._oldest is None or event_time < self._oldest:
+            self._oldest = event_time
+
+        key = self._key(rule, event)
+        group = self._groups.get(key)
+        if group is not None and event_time - group["first"] > self.window:
+            self._emit(self._groups.pop(key))
+            group = None
+
+        if group is None:
+            # Un-instrumented, this already runs inside the caller's report stage
+            _report_hit(rule, event, self.writer)
+            self.alert_count += 1
+            self._groups[key] = {
+                "rule": rule["name"], "key": key, "count": 1,
+                "first": event_time, "last": event_time,
+            }
+            self._expire()
+            while len(self._groups) > self.max_entries:
+                self._emit(self._groups.popitem(last=False)[1])
+        else:
+            group["count"] += 1
+            group["first"] = min(group["first"], event_time)
+            group["last"] = max(group["last"], event_time)
+            self._groups.move_to_end(key)
+
+    def _expire(self):
+        """Emit the groups whose window has passed, wherever they are in LRU order."""
+        if self._oldest is None or self._latest - self._oldest <= self.window:
+            return
+        expired = [
+            key for key, group in self._groups.items()
+            if self._latest - group["first"] > self.window
+        ]
+        for key in expired:
+            self._emit(self._groups.pop(key))
+        self._oldest = min((group["first"] for group in self._groups.values()), default=None)
+
+    def _emit(self, group: Dict[str, Any]):
+        if group["count"] < 2:
+            return
+        self.summary_count += 1
+        key = dict(zip(self.key_fields, group["key"]))
+        print(f"\n[{group['rule']}] {group['count']} hits for {key}\n"
+              f"- firstSeen: {group['first'].isoformat()}\n"
+              f"- lastSeen: {group['last'].isoformat()}")
+        if self.writer is not None:
+            self.writer.write_record({
+                "rule": group["rule"],
+                "summary": True,
+                "key": key,
+                "count": group["count"],
+                "firstSeen": group["first"].isoformat(),
+                "lastSeen": group["last"].isoformat(),
+            })
+
+    def sync(self):
+        """Emit groups whose window has passed and sync the hits output."""
+        if self._latest is not None:
+            self._expire()
+        if self.writer is not None:
+            self.writer.sync()
+
+    def close(self):
+        """Emit every remaining summary and close the hits output."""
+        while self._groups:
+            self._emit(self._groups.popitem(last=False)[1])
+        if self.writer is not None:
+            self.writer.close()
+
+
+def scan_file(filepath: str, rules: RuleSet, snares: SnareMatcher,
+              writer: Optional[hits_helpers.HitWriter] = None) -> int:
+    """Scan a single CloudTrail .gz file for rule matches. Returns the number of hits."""
+    hit_count = 0
+    for _, rule, event in iter_file_matches(filepath, rules, snares):
+        hit_count += 1
+        report_hit(rule, event, writer)
+    return hit_count
+
+
+# Rule set and snares shipped once to each scan worker process
+_worker_rules = None
+_worker_snares = None
+
+
+def _init_scan_worker(rules: RuleSet, snares: SnareMatcher, stats_enabled: bool = False,
+                      decoder: Optional[Decoder] = None):
+    global _worker_rules, _worker_snares
+    _worker_rules = rules
+    _worker_snares = snares
+    if decoder is not None:
+        set_decoder(decoder)
+    if stats_enabled:
+        stats_helpers.STATS.enable()
+
+
+def _scan_file_worker(
+    filepath: str
+) -> Tuple[List[Tuple[int, Dict[str, Any], Dict]], Optional[Dict[str, Any]]]:
+    """Matches of one file, plus the worker's stats for it when stats are enabled."""
+    matches = list(iter_file_matches(filepath, _worker_rules, _worker_snares))
+    if not stats_helpers.STATS.enabled:
+        return matches, None
+    snapshot = stats_helpers.STATS.snapshot()
+    stats_helpers.STATS.reset()
+    return matches, snapshot
+
+
+def list_log_files(directory: str) -> List[str]:
+    """Return the paths of all .gz files in a directory, sorted by name."""
+    return sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith(".gz")
+    )
+
+
+def scan_files(filepaths: List[str], rules: RuleSet, snares: SnareMatcher, workers: int = 1,
+               writer: Optional[hits_helpers.HitWriter] = None) -> int:
+    """Scan CloudTrail .gz files for rule matches. Returns the number of hits.
+
+    With workers > 1 files are scanned in a process pool. Hits are always
+    reported from the main process in file, then record index order, so the
+    output does not depend on the number of workers.
+    """
+    hit_count = 0
+    if workers <= 1:
+        for filepath in filepaths:
+            hit_count += scan_file(filepath, rules, snares, writer)
+        return hit_count
+
+    initargs = (rules, snares, stats_helpers.STATS.enabled, get_decoder())
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker,
+                             initargs=initargs) as pool:
+        # map() returns results in submission order, whichever worker finishes first
+        for matches, stats in pool.map(_scan_file_worker, filepaths):
+            if stats is not None:
+                stats_helpers.STATS.merge(stats)
+            for _, rule, event in matches:
+                hit_count += 1
+                report_hit(rule, event, writer)
+    return hit_count
+
+
+def scan_directory(directory: str, rules: RuleSet, snares: SnareMatcher, workers: int = 1,
+                   writer: Optional[hits_helpers.HitWriter] = None) -> int:
     """Scan all .gz files in a directory."""
-    all_hits = []
-    print(f"[+] Scanning {len(os.listdir(directory))} Cloudtrail files from '{directory}'... \n")
-    for filename in os.listdir(directory):
-        if filename.endswith(".gz"):
-            filepath = os.path.join(directory, filename)
-            all_hits.extend(scan_file(filepath, rules, snares_list))
-    return all_hits
-
-def save_hits(hits: List[Dict], output_dir: str):
-    """Save detection hits to a single JSON file in the output directory."""
-    os.makedirs(output_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = os.path.join(output_dir, f"detections_{timestamp}.json")
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(hits, f, indent=2, ensure_ascii=False)
-    
-    return output_file
-
-def detect_cloudtrail():
+    filepaths = list_log_files(directory)
+    print(f"[+] Scanning {len(filepaths)} Cloudtrail files from '{directory}'... \n")
+    return scan_files(filepaths, rules, snares, workers, writer)
+
+
+def scan_streams(keys: List[str], open_stream: Callable[[str], BinaryIO], rules: RuleSet,
+                 snares: SnareMatcher, workers: int = STREAM_WORKERS, max_pending: int = 0,
+                 writer: Optional[hits_helpers.HitWriter] = None) -> int:
+    """Scan CloudTrail objects that are streamed rather than read from disk.
+
+    open_stream(key) returns the decompressed bytes of an object. Objects are
+    fetched, decompressed and matched on a thread pool so the stages overlap;
+    at most max_pending objects (default 2 x workers) are in flight, which
+    bounds memory when the console side falls behind. Hits are reported in
+    key order. Returns the number of hits.
+    """
+    max_pending = max_pending or 2 * workers
+
+    def scan_stream(key):
+        with open_stream(key) as stream:
+            return list(iter_stream_matches(stream, rules, snares))
+
+    hit_count = 0
+    remaining = iter(keys)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque(pool.submit(scan_stream, key) for key in islice(remaining, max_pending))
+        while in_flight:
+            matches = in_flight.popleft().result()
+            for key in islice(remaining, 1):
+                in_flight.append(pool.submit(scan_stream, key))
+            for _, rule, event in matches:
+                hit_count += 1
+                report_hit(rule, event, writer)
+    return hit_count
+
+
+def current_fingerprint() -> str:
+    """Checkpoint fingerprint of the configured rules and snares."""
+    with open(RULES_FILE, "r", encoding="utf-8") as f:
+        rules_text = f.read()
+    return checkpoint_helpers.ruleset_fingerprint(rules_text, snare_registry_helpers.snare_arns())
+
+
+def scanned_objects() -> Dict[str, Dict]:
+    """S3 objects already scanned with the current rules and snares, keyed by S3 key."""
+    return checkpoint_helpers.load_checkpoint(current_fingerprint())
+
+
+def _new_writer(compression: Optional[str], snares: Optional[SnareMatcher],
+                aggregation: Optional[Dict[str, Any]]):
+    writer = hits_helpers.HitWriter(DETECTIONS_DIR, compression)
+    if aggregation is not None:
+        writer = HitAggregator(writer, snares, **aggregation)
+    return writer
+
+
+def _writer_counts(writer: hits_helpers.HitWriter) -> Tuple[int, int, int]:
+    """Output files, alerts and summaries a hits output has written so far."""
+    if isinstance(writer, HitAggregator):
+        return len(writer.files), writer.alert_count, writer.summary_count
+    return len(writer.files), 0, 0
+
+
+def _print_saved(writer: hits_helpers.HitWriter, hit_count: int,
+                 counts_before: Tuple[int, int, int]):
+    files_before, alerts_before, summaries_before = counts_before
+    files = ", ".join(writer.files[max(files_before - 1, 0):])
+    if isinstance(writer, HitAggregator):
+        alerts = writer.alert_count - alerts_before
+        summaries = writer.summary_count - summaries_before
+        if alerts or summaries:
+            print(f"\n[+] Saved {alerts} alerts and {summaries} summaries "
+                  f"for {hit_count} hits to {files}")
+    elif hit_count:
+        print(f"\n[+] Saved {hit_count} hits to {files}")
+
+
+def _run_detection(sources: List[Dict], scan: Callable[[List[Dict], hits_helpers.HitWriter], int],
+                   incremental: bool, location: str,
+                   writer: Optional[hits_helpers.HitWriter] = None,
+                   compression: Optional[str] = None, snares: Optional[SnareMatcher] = None,
+                   aggregation: Optional[Dict[str, Any]] = None):
+    """Scan sources not yet in the checkpoint, writing hits as they are found.
+
+    The checkpoint is updated once the hits are on disk, dropping files
+    stamped well before this run's window (see checkpoint_helpers.prune_checkpoint).
+
+    sources: dicts with the s3_key, etag and size of each log file
+    scan: callable scanning the pending sources into a HitWriter, returning the hit count
+    writer: hits output (HitWriter or HitAggregator) shared across runs; a new one
+    is created (and closed) if not given
+    aggregation: HitAggregator options (key_fields, window) to fold repeated hits in a new output
+    """
+    if incremental:
+        fingerprint = current_fingerprint()
+        scanned = checkpoint_helpers.load_checkpoint(fingerprint)
+        pending = [
+            source for source in sources
+            if not checkpoint_helpers.is_scanned(
+                scanned, source["s3_key"], source["etag"], source["size"]
+            )
+        ]
+        print(f"[+] Scanning {len(pending)} new Cloudtrail files from {location}... \n")
+    else:
+        pending = sources
+        print(f"[+] Scanning {len(pending)} Cloudtrail files from {location}... \n")
+
+    own_writer = writer is None
+    if own_writer:
+        writer = _new_writer(compression, snares, aggregation)
+    try:
+        counts_before = _writer_counts(writer)
+        with stats_helpers.STATS.stage("scan") as counters:
+            hit_count = scan(pending, writer)
+            counters["records"] = len(pending)
+            counters["bytes"] = sum(source["size"] or 0 for source in pending)
+    finally:
+        if own_writer:
+            writer.close()
+        else:
+            writer.sync()
+
+    _print_saved(writer, hit_count, counts_before)
+
+    # Only checkpoint once the hits are safely on disk
+    if incremental:
+        for source in pending:
+            checkpoint_helpers.mark_scanned(
+                scanned, source["s3_key"], source["etag"], source["size"]
+            )
+        pruned = checkpoint_helpers.prune_checkpoint(
+            scanned, (source["s3_key"] for source in sources)
+        )
+        if pending or pruned:
+            checkpoint_helpers.save_checkpoint(fingerprint, scanned)
+
+
+def detect_cloudtrail(workers: int = 1, incremental: bool = True, compression: Optional[str] = None,
+                      aggregation: Optional[Dict[str, Any]] = None):
 
     print("\nAnalyzing logs\n")
 
-    rules = load_rules_from_yaml("detection_rules.yaml")
-    snares_list = config_helpers.AWS_snares_arn_list_get()
-    results = scan_directory("logs_cloudtrail", rules, snares_list)
+    rules = load_rules_from_yaml(RULES_FILE)
+    snares = SnareMatcher(snare_registry_helpers.snare_arns())
+
+    index = checkpoint_helpers.load_objects_index(LOGS_DIR)
+    sources = [
+        dict(
+            checkpoint_helpers.local_file_source(LOGS_DIR, os.path.basename(filepath), index),
+            path=filepath,
+        )
+        for filepath in list_log_files(LOGS_DIR)
+    ]
+
+    _run_detection(
+        sources,
+        lambda pending, writer: scan_files(
+            [source["path"] for source in pending], rules, snares, workers, writer
+        ),
+        incremental,
+        f"'{LOGS_DIR}'",
+        compression=compression,
+        snares=snares,
+        aggregation=aggregation,
+    )
+
+
+def detect_cloudtrail_objects(objects: List[Dict], open_stream: Callable[[str], BinaryIO],
+                              workers: int = STREAM_WORKERS, incremental: bool = True,
+                              writer: Optional[hits_helpers.HitWriter] = None,
+                              compression: Optional[str] = None,
+                              aggregation: Optional[Dict[str, Any]] = None):
+    """Detect on S3 objects streamed straight into the matcher, without staging them on disk.
+
+    objects: S3 listing entries (Key, ETag, Size)
+    open_stream: returns the decompressed binary stream of an object key
+    writer: hits output to append to (e.g. one writer for a whole watch session)
+    aggregation: HitAggregator options, used when no writer is given
+    """
+
+    print("\nAnalyzing logs\n")
+
+    rules = load_rules_from_yaml(RULES_FILE)
+    snares = SnareMatcher(snare_registry_helpers.snare_arns())
+
+    sources = [
+        {"s3_key": obj["Key"], "etag": obj.get("ETag"), "size": obj.get("Size")}
+        for obj in objects
+    ]
+
+    _run_detection(
+        sources,
+        lambda pending, writer: scan_streams(
+            [source["s3_key"] for source in pending], open_stream, rules, snares, workers,
+            writer=writer,
+        ),
+        incremental,
+        "S3",
+        writer,
+        compression,
+        snares,
+        aggregation,
+    )
+
+
+def detect_cloudtrail_records(records: List[Dict], writer: Optional[hits_helpers.HitWriter] = None,
+                              compression: Optional[str] = None,
+                              aggregation: Optional[Dict[str, Any]] = None) -> int:
+    """Detect on CloudTrail records that do not come from log files, e.g. from the LookupEvents API.
+
+    The records go through the same snare matching and rules as log files.
+    writer: hits output to append to (e.g. one writer for a whole polling session)
+    aggregation: HitAggregator options, used when no writer is given
+    Returns the number of hits.
+    """
+    rules = load_rules_from_yaml(RULES_FILE)
+    snares = SnareMatcher(snare_registry_helpers.snare_arns())
+
+    own_writer = writer is None
+    if own_writer:
+        writer = _new_writer(compression, snares, aggregation)
+    hit_count = 0
+    try:
+        counts_before = _writer_counts(writer)
+        with stats_helpers.STATS.stage("scan") as counters:
+            for _, rule, event in iter_event_matches(records, rules, snares):
+                hit_count += 1
+                report_hit(rule, event, writer)
+            counters["records"] = len(records)
+    finally:
+        if own_writer:
+            writer.close()
+        else:
+            writer.sync()
 
-    if results:
-        output_file = save_hits(results, "logs_detections")
-        print(f"\n[+] Saved {len(results)} hits to {output_file}")
\ No newline at end of file
+    _print_saved(writer, hit_count, counts_before)
+    return hit_count
@@ -0,0 +1,239 @@
+"""Local indexed store of parsed CloudTrail records for repeated queries and retro-hunts."""
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Iterator, Iterable
+
+from core import checkpoint_helpers
+from core import detection_logic
+from core import snare_registry_helpers
+
+EVENT_STORE_FILE = os.path.join("logs_cloudtrail_store", "events.db")
+
+# Records inserted per transaction while ingesting
+INGEST_BATCH_SIZE = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    event_id TEXT UNIQUE,
+    event_time TEXT,
+    event_source TEXT,
+    event_name TEXT,
+    aws_region TEXT,
+    source_ip TEXT,
+    principal_arn TEXT,
+    source_key TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS event_resources (
+    event_rowid INTEGER NOT NULL REFERENCES events (id),
+    resource TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    s3_key TEXT PRIMARY KEY,
+    etag TEXT,
+    size INTEGER,
+    ingested_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (event_time);
+CREATE INDEX IF NOT EXISTS events_name ON events (event_name);
+CREATE INDEX IF NOT EXISTS events_principal ON events (principal_arn);
+CREATE INDEX IF NOT EXISTS event_resources_resource ON event_resources (resource);
+"""
+
+
+@contextmanager
+def _connect(store_file: str = EVENT_STORE_FILE):
+    os.makedirs(os.path.dirname(store_file) or ".", exist_ok=True)
+    connection = sqlite3.connect(store_file, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.executescript(_SCHEMA)
+            yield connection
+    finally:
+        connection.close()
+
+
+def event_resources(event: Dict) -> List[str]:
+    """Resource identifiers an event touches, as indexed by the store.
+
+    S3 object ARNs are also indexed under their bucket ARN, and secretId
+    values are indexed as given (name or ARN).
+    """
+    resources = set()
+    for resource in event.get("resources") or []:
+        arn = resource.get("ARN")
+        if arn:
+            resources.add(arn)
+            if arn.startswith("arn:aws:s3:::") and "/" in arn:
+                resources.add(arn.split("/", 1)[0])
+    params = event.get("requestParameters")
+    if isinstance(params, dict):
+        if params.get("bucketName"):
+            resources.add(f"arn:aws:s3:::{params['bucketName']}")
+        if params.get("secretId"):
+            resources.add(params["secretId"])
+    return sorted(resources)
+
+
+def _insert_events(connection, events: Iterable[Dict], source_key: str) -> int:
+    inserted = 0
+    for event in events:
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO events (event_id, event_time, event_source, event_name, "
+            "aws_region, source_ip, principal_arn, source_key, record) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                event.get("eventID"),
+                event.get("eventTime"),
+                event.get("eventSource"),
+                event.get("eventName"),
+                event.get("awsRegion"),
+                event.get("sourceIPAddress"),
+                (event.get("userIdentity") or {}).get("arn"),
+                source_key,
+                json.dumps(event, ensure_ascii=False),
+            ),
+        )
+        # Duplicate eventIDs (overlapping downloads) are skipped
+        if cursor.rowcount:
+            connection.executemany(
+                "INSERT INTO event_resources (event_rowid, resource) VALUES (?, ?)",
+                [(cursor.lastrowid, resource) for resource in event_resources(event)],
+            )
+            inserted += 1
+    return inserted
+
+
+def ingest_directory(directory: str = detection_logic.LOGS_DIR, store_file: str = EVENT_STORE_FILE):
+    """Load the records of downloaded CloudTrail files that are not in the store yet."""
+
+    index = checkpoint_helpers.load_objects_index(directory)
+    total = 0
+    with _connect(store_file) as connection:
+        for filepath in detection_logic.list_log_files(directory):
+            source = checkpoint_helpers.local_file_source(
+                directory, os.path.basename(filepath), index
+            )
+            row = connection.execute(
+                "SELECT etag, size FROM ingested_files WHERE s3_key = ?", (source["s3_key"],)
+            ).fetchone()
+            if row is not None and checkpoint_helpers.is_scanned(
+                {source["s3_key"]: dict(row)}, source["s3_key"], source["etag"], source["size"]
+            ):
+                continue
+
+            inserted = 0
+            batch = []
+            for event in detection_logic.iter_cloudtrail_file(filepath):
+                batch.append(event)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    inserted += _insert_events(connection, batch, source["s3_key"])
+                    batch = []
+            inserted += _insert_events(connection, batch, source["s3_key"])
+
+            connection.execute(
+                "INSERT OR REPLACE INTO ingested_files (s3_key, etag, size, ingested_at) "
+                "VALUES (?, ?, ?, ?)",
+                (source["s3_key"], source["etag"], source["size"],
+                 datetime.now(timezone.utc).isoformat()),
+            )
+            connection.commit()
+            print(f"[+] Ingested {inserted} events from {source['s3_key']}")
+            total += inserted
+
+    print(f"[+] Ingested {total} new events into {store_file}")
+
+
+def query_events(event_name: Optional[str] = None, principal: Optional[str] = None,
+                 resource: Optional[str] = None, since: Optional[str] = None,
+                 until: Optional[str] = None, limit: Optional[int] = None,
+                 store_file: str = EVENT_STORE_FILE) -> Iterator[Dict]:
+    """Yield stored events matching all given filters, ordered by eventTime.
+
+    since / until: ISO 8601 eventTime bounds (inclusive / exclusive)
+    resource: an ARN, bucket ARN or secret id as indexed by event_resources()
+    """
+    query = "SELECT DISTINCT events.record, events.event_time FROM events"
+    conditions, params = [], []
+    if resource:
+        query += " JOIN event_resources ON event_resources.event_rowid = events.id"
+        conditions.append("event_resources.resource = ?")
+        params.append(resource)
+    if event_name:
+        conditions.append("events.event_name = ?")
+        params.append(event_name)
+    if principal:
+        conditions.append("events.principal_arn = ?")
+        params.append(principal)
+    if since:
+        conditions.append("events.event_time >= ?")
+        params.append(since)
+    if until:
+        conditions.append("events.event_time < ?")
+        params.append(until)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY events.event_time"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    with _connect(store_file) as connection:
+        for row in connection.execute(query, params):
+            yield json.loads(row["record"])
+
+
+def retro_hunt(since: Optional[str] = None, until: Optional[str] = None,
+               store_file: str = EVENT_STORE_FILE) -> int:
+    """Run the current rules and snares over the stored history. Returns the number of hits.
+
+    Only events indexed under a snare ARN or snare name are decoded, the
+    rules are then applied exactly as in live detection.
+    """
+    rules = detection_logic.load_rules_from_yaml(detection_logic.RULES_FILE)
+    snare_arns = snare_registry_helpers.snare_arns()
+    snares = detection_logic.SnareMatcher(snare_arns)
+
+    lookup_values = set(snare_arns) | snare_registry_helpers.snare_names("secret")
+    for arn in snare_arns:
+        if arn.startswith("arn:aws:s3:::"):
+            lookup_values.add(arn.split("/", 1)[0])
+
+    hit_count = 0
+    with _connect(store_file) as connection:
+        connection.execute("CREATE TEMP TABLE hunt_resources (resource TEXT PRIMARY KEY)")
+        connection.executemany(
+            "INSERT OR IGNORE INTO hunt_resources (resource) VALUES (?)",
+            [(value,) for value in lookup_values],
+        )
+
+        query = (
+            "SELECT DISTINCT events.id, events.record, events.event_time FROM events "
+            "JOIN event_resources ON event_resources.event_rowid = events.id "
+            "JOIN hunt_resources ON hunt_resources.resource = event_resources.resource"
+        )
+        conditions, params = [], []
+        if since:
+            conditions.append("events.event_time >= ?")
+            params.append(since)
+        if until:
+            conditions.append("events.event_time < ?")
+            params.append(until)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY events.event_time"
+
+        events = (json.loads(row["record"]) for row in connection.execute(query, params))
+        for _, rule, event in detection_logic.iter_event_matches(events, rules, snares):
+            hit_count += 1
+            detection_logic.print_hit(rule, event)
+
+    print(f"\n[+] Retro-hunt found {hit_count} hits")
+    return hit_count
@@ -0,0 +1,137 @@
+"""Incremental newline-delimited JSON writer for detection hits."""
+
+import atexit
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+# Start a new output file after this many (uncompressed) bytes or seconds
+ROTATE_BYTES = 100 * 1024 * 1024
+ROTATE_SECONDS = 3600
+
+COMPRESSIONS = (None, "gzip", "zstd")
+EXTENSIONS = {None: ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+class HitWriter:
+    """Append hits to NDJSON files as they are found, one JSON object per line.
+
+    Every hit is flushed to the OS straight away so shippers can tail the
+    file, files rotate by size and age, and the current file is flushed,
+    fsynced and closed on close() - which also runs at interpreter exit.
+    Files are only created once there is a hit to write.
+    """
+
+    def __init__(self, output_dir: str, compression: Optional[str] = None,
+                 rotate_bytes: int = ROTATE_BYTES, rotate_seconds: int = ROTATE_SECONDS):
+        if compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unsupported hits compression '{compression}', use one of {COMPRESSIONS}"
+            )
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise RuntimeError(
+                    "[!] zstd compression needs the 'zstandard' package: pip install zstandard"
+                ) from e
+            self._zstandard = zstandard
+
+        self.output_dir = output_dir
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.files: List[str] = []
+        self.count = 0
+
+        self._raw = None
+        self._stream = None
+        self._bytes = 0
+        self._opened_at = 0.0
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        sequence = len(self.files)
+        while True:
+            filename = f"detections_{timestamp}_{sequence:03}{EXTENSIONS[self.compression]}"
+            path = os.path.join(self.output_dir, filename)
+            try:
+                # Never overwrite the output of another run started in the same second
+                self._raw = open(path, "xb")
+                break
+            except FileExistsError:
+                sequence += 1
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif self.compression == "zstd":
+            self._stream = self._zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+        self.files.append(path)
+        self._bytes = 0
+        self._opened_at = time.monotonic()
+
+    def _flush(self):
+        if self.compression == "zstd":
+            self._stream.flush(self._zstandard.FLUSH_BLOCK)
+        else:
+            self._stream.flush()
+        self._raw.flush()
+
+    def write(self, rule: Dict[str, Any], event: Dict):
+        """Append one hit and flush it."""
+        self.write_record({
+            "rule": rule["name"],
+            "account": event.get("recipientAccountId"),
+            "detectedAt": datetime.now(timezone.utc).isoformat(),
+            "event": event,
+        })
+
+    def write_record(self, record: Dict):
+        if self._stream is not None and (
+            self._bytes >= self.rotate_bytes
+            or time.monotonic() - self._opened_at >= self.rotate_seconds
+        ):
+            self._close_file()
+        if self._stream is None:
+            self._open()
+
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._stream.write(line)
+        self._flush()
+        self._bytes += len(line)
+        self.count += 1
+
+    def sync(self):
+        """Make sure every hit written so far is on disk."""
+        if self._stream is not None:
+            self._flush()
+            os.fsync(self._raw.fileno())
+
+    def close(self):
+        """Finish the current file (compression trailer included) and sync it to disk."""
+        self._close_file()
+        atexit.unregister(self.close)
+
+    def _close_file(self):
+        if self._stream is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        self._stream = None
+        self._raw = None
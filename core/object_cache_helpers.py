@@ -0,0 +1,172 @@
+"""Size-bounded local cache of downloaded CloudTrail objects, keyed by S3 key and ETag."""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+CACHE_DIR = "logs_cloudtrail_cache"
+
+# Default byte budget of the cache
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    s3_key TEXT NOT NULL,
+    etag TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects (last_used);
+"""
+
+
+def object_digest(s3_key: str, etag: str) -> str:
+    return hashlib.sha256(f"{s3_key}\0{etag}".encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(source: str, target: str):
+    if os.path.exists(target):
+        os.unlink(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        # Other filesystem, or one without hard links
+        shutil.copyfile(source, target)
+
+
+class ObjectCache:
+    """Local copies of S3 objects, evicted least recently used beyond max_bytes.
+
+    Entries are addressed by S3 key + ETag: an object rewritten in S3 gets a
+    new ETag, so a stale copy is never served and just ages out. Files live
+    under <directory>/objects/<digest[:2]>/<digest>, with their size and
+    last use in a SQLite index next to them. Copies handed out are hard
+    links, so evicting an entry never removes a file a caller still uses.
+    Safe to share between the threads of one process.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            os.path.join(directory, "index.db"), timeout=30, check_same_thread=False
+        )
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+        self.total_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM objects"
+        ).fetchone()[0]
+        with self._lock:
+            # The budget may have been lowered since the last run
+            self._evict()
+
+    def path(self, s3_key: str, etag: str) -> str:
+        digest = object_digest(s3_key, etag)
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def get(self, s3_key: str, etag: str) -> Optional[str]:
+        """Path of the cached copy, marked as just used, or None."""
+        with self._lock:
+            return self._get(object_digest(s3_key, etag), self.path(s3_key, etag))
+
+    def fetch(self, s3_key: str, etag: str, download: Callable[[str], None], target: str) -> bool:
+        """Put a copy of the object at target, calling download(path) on a cache miss.
+
+        Returns True if the copy came from the cache.
+        """
+        digest, path = object_digest(s3_key, etag), self.path(s3_key, etag)
+        with self._lock:
+            if self._get(digest, path) is not None:
+                _link_or_copy(path, target)
+                return True
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            download(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        size = os.path.getsize(path)
+
+        with self._lock:
+            _link_or_copy(path, target)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO objects (digest, s3_key, etag, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (digest, s3_key, etag, size, time.time()),
+                )
+            self.total_bytes += size
+            self._evict(keep=digest)
+        return False
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _get(self, digest: str, path: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT size FROM objects WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is not None and not os.path.exists(path):
+            # Deleted from disk behind our back
+            self._drop([(digest, row[0])])
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        with self._connection:
+            self._connection.execute(
+                "UPDATE objects SET last_used = ? WHERE digest = ?", (time.time(), digest)
+            )
+        self.hits += 1
+        return path
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used entries until the cache fits max_bytes (lock held).
+
+        keep (the entry just added) is never evicted, so one object larger
+        than the budget still gets cached until the next one arrives.
+        """
+        if self.total_bytes <= self.max_bytes:
+            return
+        excess = self.total_bytes - self.max_bytes
+        evicted = []
+        rows = self._connection.execute("SELECT digest, size FROM objects ORDER BY last_used")
+        for digest, size in rows:
+            if excess <= 0:
+                break
+            if digest == keep:
+                continue
+            evicted.append((digest, size))
+            excess -= size
+        self._drop(evicted)
+
+    def _drop(self, entries):
+        for digest, _ in entries:
+            try:
+                os.remove(os.path.join(self.directory, "objects", digest[:2], digest))
+            except FileNotFoundError:
+                pass
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM objects WHERE digest = ?", [(digest,) for digest, _ in entries]
+            )
+        self.total_bytes -= sum(size for _, size in entries)
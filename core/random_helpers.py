@@ -29,6 +29,21 @@ def generate_aws_resource_name():
     # Truncate if exceeds 63 characters (e.g., for S3 buckets)
     return name[:63]
 
+def generate_unique_aws_resource_names(count, taken=()):
+    """Generate `count` distinct resource names that are not in `taken`."""
+    taken = set(taken)
+    capacity = len(sensitive_keywords) * len(adjectives) * len(set(nouns)) * 100
+    if count > capacity - len(taken):
+        raise ValueError(f"Cannot generate {count} unique names, only {capacity - len(taken)} left")
+
+    names = []
+    while len(names) < count:
+        name = generate_aws_resource_name()
+        if name not in taken:
+            taken.add(name)
+            names.append(name)
+    return names
+
 # Example usage
 if __name__ == "__main__":
     for _ in range(10):
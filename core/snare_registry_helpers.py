@@ -0,0 +1,194 @@
+"""Indexed registry of deployed snares, stored in SQLite next to config.yaml."""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Iterable
+
+from core import config_helpers
+
+REGISTRY_FILE = os.path.join(os.path.dirname(config_helpers.SETTINGLS_FILE), "snares.db")
+
+# config.yaml key used for snares before the registry existed
+LEGACY_CONFIG_KEY = "AWS_snares_arn_list"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snares (
+    arn TEXT PRIMARY KEY,
+    resource_type TEXT NOT NULL,
+    region TEXT,
+    account_id TEXT,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    seeded_objects TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS snares_type ON snares (resource_type);
+CREATE INDEX IF NOT EXISTS snares_region ON snares (region);
+CREATE INDEX IF NOT EXISTS snares_name ON snares (name);
+CREATE INDEX IF NOT EXISTS snares_account ON snares (account_id);
+"""
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def parse_arn(arn: str) -> Dict[str, Optional[str]]:
+    """Derive the resource type, region, account and name of a snare from its ARN."""
+    if arn.startswith("arn:aws:s3:::"):
+        # Bucket ARNs carry no region or account
+        return {"resource_type": "S3", "region": None, "account_id": None,
+                "name": arn[len("arn:aws:s3:::"):].split("/", 1)[0]}
+    parts = arn.split(":", 6)
+    if len(parts) == 7 and parts[2] == "secretsmanager":
+        # Secret ARNs end with a random "-XXXXXX" suffix the name does not carry
+        return {"resource_type": "secret", "region": parts[3], "account_id": parts[4],
+                "name": parts[6].rsplit("-", 1)[0]}
+    return {"resource_type": parts[2] if len(parts) > 2 else "unknown",
+            "region": parts[3] if len(parts) > 3 else None,
+            "account_id": parts[4] or None if len(parts) > 4 else None, "name": arn}
+
+
+@contextmanager
+def _connect():
+    connection = sqlite3.connect(REGISTRY_FILE, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        with connection:
+            _initialize(connection)
+            yield connection
+    finally:
+        connection.close()
+
+
+def _initialize(connection):
+    """Create the schema and move snares listed in config.yaml into the registry (once)."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        connection.executescript(_SCHEMA)
+        if LEGACY_CONFIG_KEY in config_helpers.load_settings():
+            with config_helpers.update_settings() as settings:
+                arns = settings.pop(LEGACY_CONFIG_KEY, None) or []
+                _insert(connection, [{"arn": arn} for arn in arns])
+                connection.commit()
+            print(f"[+] Migrated {len(arns)} snares from {config_helpers.SETTINGLS_FILE} "
+                  f"to {REGISTRY_FILE}")
+        _initialized = True
+
+
+def _insert(connection, snares: Iterable[Dict]):
+    now = datetime.now(timezone.utc).isoformat()
+    # Snares without an account in their ARN (buckets) belong to the configured account
+    default_account_id = config_helpers.load_settings().get("AWS_account_id")
+    rows = []
+    for snare in snares:
+        parsed = parse_arn(snare["arn"])
+        rows.append((
+            snare["arn"],
+            snare.get("resource_type") or parsed["resource_type"],
+            snare.get("region") or parsed["region"],
+            snare.get("account_id") or parsed["account_id"] or default_account_id,
+            snare.get("name") or parsed["name"],
+            snare.get("created_at") or now,
+            json.dumps(snare.get("seeded_objects") or []),
+        ))
+    connection.executemany(
+        "INSERT OR IGNORE INTO snares "
+        "(arn, resource_type, region, account_id, name, created_at, seeded_objects) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def _to_dict(row) -> Dict:
+    snare = dict(row)
+    snare["seeded_objects"] = json.loads(snare["seeded_objects"])
+    return snare
+
+
+def add_snare(arn: str, region: Optional[str] = None):
+    """Register a snare. Type and name are derived from the ARN."""
+    add_snares([{"arn": arn, "region": region}])
+
+
+def add_snares(snares: List[Dict]):
+    """Register many snares in one transaction.
+
+    Each dict needs "arn", "region" and "account_id" are optional.
+    """
+    with _connect() as connection:
+        _insert(connection, snares)
+
+
+def remove_snare(arn: str):
+    with _connect() as connection:
+        connection.execute("DELETE FROM snares WHERE arn = ?", (arn,))
+
+
+def get_snare(arn: str) -> Optional[Dict]:
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM snares WHERE arn = ?", (arn,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def find_snare(name: str, resource_type: str) -> Optional[Dict]:
+    """Look up a snare by bucket / secret name."""
+    with _connect() as connection:
+        row = connection.execute(
+            "SELECT * FROM snares WHERE name = ? AND resource_type = ?", (name, resource_type)
+        ).fetchone()
+    return _to_dict(row) if row else None
+
+
+def list_snares(resource_type: Optional[str] = None, region: Optional[str] = None,
+                account_id: Optional[str] = None) -> List[Dict]:
+    """Return registered snares, optionally filtered by type, region and account, ordered by ARN."""
+    query = "SELECT * FROM snares"
+    conditions, params = [], []
+    if resource_type:
+        conditions.append("resource_type = ?")
+        params.append(resource_type)
+    if region:
+        conditions.append("region = ?")
+        params.append(region)
+    if account_id:
+        conditions.append("account_id = ?")
+        params.append(account_id)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    with _connect() as connection:
+        return [_to_dict(row) for row in connection.execute(query + " ORDER BY arn", params)]
+
+
+def snare_arns(resource_type: Optional[str] = None) -> List[str]:
+    return [snare["arn"] for snare in list_snares(resource_type)]
+
+
+def snare_names(resource_type: str) -> set:
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT name FROM snares WHERE resource_type = ?", (resource_type,)
+        )
+        return {row["name"] for row in rows}
+
+
+def add_seeded_object(arn: str, object_key: str):
+    """Record a mock data object uploaded to a snare."""
+    with _connect() as connection:
+        row = connection.execute(
+            "SELECT seeded_objects FROM snares WHERE arn = ?", (arn,)
+        ).fetchone()
+        if row is None:
+            return
+        seeded_objects = json.loads(row["seeded_objects"])
+        if object_key not in seeded_objects:
+            seeded_objects.append(object_key)
+        connection.execute(
+            "UPDATE snares SET seeded_objects = ? WHERE arn = ?", (json.dumps(seeded_objects), arn)
+        )
@@ -0,0 +1,203 @@
+"""Per-stage timing and counters for the detection pipeline.
+
+Printed with --stats or exported for Prometheus.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Callable
+
+# Pipeline stages in the order they run
+STAGES = ("lookup", "list", "download", "decompress", "prescreen", "parse", "match", "report",
+          "scan")
+
+METRIC_PREFIX = "awsnare"
+
+
+class PipelineStats:
+    """Wall time, CPU time, records and bytes per stage, plus per-rule counters.
+
+    Coarse stages (listing, download, the whole scan) are always recorded.
+    The per-record stages (decompress, prescreen, parse, match, report) and
+    the rule counters are only measured once enable() is called, so
+    detection pays nothing for them otherwise. In streaming mode
+    "decompress" includes fetching the object, because both happen on read,
+    and "prescreen" includes decoding the records it lets through.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.rules: Dict[str, Dict[str, int]] = {}
+            self.files = 0
+            self.newest_event_time: Optional[str] = None
+
+    def add(self, stage: str, wall: float = 0.0, cpu: float = 0.0, records: int = 0, size: int = 0):
+        with self._lock:
+            totals = self.stages.setdefault(
+                stage, {"wall": 0.0, "cpu": 0.0, "records": 0, "bytes": 0}
+            )
+            totals["wall"] += wall
+            totals["cpu"] += cpu
+            totals["records"] += records
+            totals["bytes"] += size
+
+    @contextmanager
+    def stage(self, name: str, cpu_clock: Callable[[], float] = time.process_time):
+        """Time a block. The yielded dict takes "records" and "bytes" counts.
+
+        The default CPU clock covers the whole process, which suits stages
+        fanned out to thread pools; use time.thread_time for code that runs
+        concurrently with other instrumented stages.
+        """
+        counters = {"records": 0, "bytes": 0}
+        wall_start, cpu_start = time.perf_counter(), cpu_clock()
+        try:
+            yield counters
+        finally:
+            self.add(name, time.perf_counter() - wall_start, cpu_clock() - cpu_start,
+                     counters["records"], counters["bytes"])
+
+    def add_rules(self, evaluations: Dict[str, int], hits: Dict[str, int]):
+        with self._lock:
+            for name, count in evaluations.items():
+                self.rules.setdefault(name, {"evaluations": 0, "hits": 0})["evaluations"] += count
+            for name, count in hits.items():
+                self.rules.setdefault(name, {"evaluations": 0, "hits": 0})["hits"] += count
+
+    def add_file(self, newest_event_time: Optional[str] = None):
+        """Count a scanned file and the newest eventTime (ISO 8601) it contained."""
+        with self._lock:
+            self.files += 1
+            if newest_event_time and (
+                self.newest_event_time is None or newest_event_time > self.newest_event_time
+            ):
+                self.newest_event_time = newest_event_time
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Picklable copy of the counters, e.g. to send back from a worker process."""
+        with self._lock:
+            return {
+                "stages": {name: dict(totals) for name, totals in self.stages.items()},
+                "rules": {name: dict(counts) for name, counts in self.rules.items()},
+                "files": self.files,
+                "newest_event_time": self.newest_event_time,
+            }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        for name, totals in snapshot["stages"].items():
+            self.add(name, totals["wall"], totals["cpu"], totals["records"], totals["bytes"])
+        self.add_rules(
+            {name: counts["evaluations"] for name, counts in snapshot["rules"].items()},
+            {name: counts["hits"] for name, counts in snapshot["rules"].items()},
+        )
+        with self._lock:
+            self.files += snapshot["files"]
+            newest = snapshot["newest_event_time"]
+            if newest and (self.newest_event_time is None or newest > self.newest_event_time):
+                self.newest_event_time = newest
+
+    def detection_lag(self) -> Optional[float]:
+        """Seconds between the newest event scanned and now."""
+        if not self.newest_event_time:
+            return None
+        try:
+            newest = datetime.fromisoformat(self.newest_event_time.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return (datetime.now(timezone.utc) - newest).total_seconds()
+
+    def _ordered_stages(self):
+        return sorted(
+            self.stages.items(),
+            key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES),
+        )
+
+    def print_summary(self):
+        print("\n[+] Detection pipeline stats")
+        print(f"{'stage':<12} {'wall s':>9} {'cpu s':>9} {'records':>10} {'MB':>9} "
+              f"{'records/s':>11}")
+        for name, totals in self._ordered_stages():
+            rate = totals["records"] / totals["wall"] if totals["wall"] else 0
+            print(f"{name:<12} {totals['wall']:>9.3f} {totals['cpu']:>9.3f} "
+                  f"{totals['records']:>10} {totals['bytes'] / 1e6:>9.1f} {rate:>11.0f}")
+        if self.rules:
+            print(f"\n{'rule':<40} {'evaluations':>12} {'hits':>8}")
+            for name, counts in sorted(self.rules.items()):
+                print(f"{name:<40} {counts['evaluations']:>12} {counts['hits']:>8}")
+        print(f"\n- files scanned: {self.files}")
+        if self.files and "scan" in self.stages:
+            print(f"- seconds per file: {self.stages['scan']['wall'] / self.files:.3f}")
+        lag = self.detection_lag()
+        if lag is not None:
+            print(f"- detection lag: {lag:.0f}s (newest event {self.newest_event_time})")
+
+    def prometheus_text(self) -> str:
+        """The counters in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(
+                    f'{key}="{_escape_label(str(val))}"' for key, val in labels.items()
+                )
+                if label_text:
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{METRIC_PREFIX}_{name} {value}")
+
+        stages = self._ordered_stages()
+        metric("stage_wall_seconds", "gauge", "Wall time spent per pipeline stage in this run.",
+               [({"stage": name}, totals["wall"]) for name, totals in stages])
+        metric("stage_cpu_seconds", "gauge", "CPU time spent per pipeline stage in this run.",
+               [({"stage": name}, totals["cpu"]) for name, totals in stages])
+        metric("stage_records", "gauge",
+               "Records (or objects) processed per pipeline stage in this run.",
+               [({"stage": name}, totals["records"]) for name, totals in stages])
+        metric("stage_bytes", "gauge", "Bytes processed per pipeline stage in this run.",
+               [({"stage": name}, totals["bytes"]) for name, totals in stages])
+        metric("rule_evaluations", "gauge", "Times a rule was evaluated in this run.",
+               [({"rule": name}, counts["evaluations"])
+                for name, counts in sorted(self.rules.items())])
+        metric("rule_hits", "gauge", "Hits per rule in this run.",
+               [({"rule": name}, counts["hits"]) for name, counts in sorted(self.rules.items())])
+        metric("files_scanned", "gauge", "CloudTrail files scanned in this run.",
+               [({}, self.files)])
+        lag = self.detection_lag()
+        if lag is not None:
+            metric("detection_lag_seconds", "gauge",
+                   "Age of the newest event scanned when the metrics were written.", [({}, lag)])
+        metric("last_run_timestamp_seconds", "gauge", "Unix time the metrics were written.",
+               [({}, time.time())])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the metrics for the node_exporter textfile collector (atomically)."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        print(f"[+] Wrote detection metrics to {path}")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Process-wide stats of the current detection run
+STATS = PipelineStats()